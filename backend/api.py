@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -9,12 +10,30 @@ from routes.query import router as query_router
 from routes.ingestion import router as ingestion_router
 from routes.templates import router as template_router
 from routes.repositories import router as repository_router
+from routes.metrics import router as metrics_router
+from services.watch_manager import stop_all_watches
+from http_clients import open_clients, close_clients
+from executors import shutdown_executors
+from chunker import shutdown_chunk_pool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared, pooled HTTP clients for the embedding and LLM servers
+    await open_clients()
+    yield
+    # Stop workspace watchers so no ingest is cut off mid-write
+    await stop_all_watches()
+    await close_clients()
+    # Let queued Chroma writes finish, then stop the thread and parser pools
+    shutdown_executors()
+    shutdown_chunk_pool()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="AskHim API",
     description="API for code retrieval augmented generation and repository ingestion",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware to allow cross-origin requests
@@ -24,7 +43,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
-    expose_headers=["Content-Type", "Content-Length"]  # Expose headers needed for SSE
+    expose_headers=["Content-Type", "Content-Length", "Server-Timing"]  # Expose headers needed for SSE and timings
 )
 
 # Include routers for different features
@@ -32,6 +51,8 @@ app.include_router(query_router, prefix="/api", tags=["Query"])
 app.include_router(ingestion_router, prefix="/api", tags=["Ingestion"])
 app.include_router(template_router, prefix="/api", tags=["Templates"])
 app.include_router(repository_router, prefix="/api", tags=["Repositories"])
+# Served at the root, where Prometheus scrapes by default
+app.include_router(metrics_router, tags=["Metrics"])
 
 @app.get("/", tags=["Root"])
 async def root():
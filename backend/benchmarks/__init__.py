@@ -0,0 +1,2 @@
+# Benchmarks package initialization
+# Run from backend/: python -m benchmarks.run --help
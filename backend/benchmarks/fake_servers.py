@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import re
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+
+# Deterministic stand-ins for the embedding and LLM servers.
+# /v1/embeddings answers OpenAI-style embedding requests with hashed
+# bag-of-words vectors: the same text always gets the same vector, and texts
+# sharing identifiers end up close, so retrieval still behaves like
+# retrieval. /v1/chat/completions answers with a fixed-length reply, whole
+# or as an SSE stream. Latency and throughput are configurable, so runs are
+# comparable across machines and commits without a GPU.
+
+_TOKEN = re.compile(r"[A-Za-z][a-z]+|[A-Z]+(?![a-z])|\d+")
+
+class FakeSettings:
+    def __init__(self, embedding_dim=768, embedding_latency=0.005, embedding_item_latency=0.0005,
+                 embedding_concurrency=8, llm_first_token=0.1, llm_tokens_per_sec=100.0,
+                 llm_answer_tokens=64, llm_concurrency=16):
+        self.embedding_dim = embedding_dim
+        # Seconds per request, plus seconds per input text
+        self.embedding_latency = embedding_latency
+        self.embedding_item_latency = embedding_item_latency
+        # Requests served at once; the rest queue, which caps throughput
+        self.embedding_concurrency = embedding_concurrency
+        self.llm_first_token = llm_first_token
+        self.llm_tokens_per_sec = llm_tokens_per_sec
+        self.llm_answer_tokens = llm_answer_tokens
+        self.llm_concurrency = llm_concurrency
+
+    def as_dict(self):
+        return dict(vars(self))
+
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+# Code reuses a small vocabulary; hashing each token once keeps the server cheap
+_token_hash = functools.lru_cache(maxsize=1 << 16)(_hash)
+
+def fake_embedding(text, dim):
+    """A unit vector from the identifier tokens of text (the hashing trick)"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in _TOKEN.findall(text):
+        h = _token_hash(token.lower())
+        vector[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    # A small text-specific component keeps distinct texts (and empty ones) apart
+    h = _hash(text)
+    vector[h % dim] += 0.5
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+def fake_answer(question, tokens):
+    words = [w.lower() for w in _TOKEN.findall(question)] or ["answer"]
+    return [f"{words[i % len(words)]} " for i in range(tokens)]
+
+def create_app(settings=None):
+    settings = settings or FakeSettings()
+    app = FastAPI(title="AskHim benchmark stand-ins")
+    stats = {"embedding_requests": 0, "embedding_inputs": 0, "llm_requests": 0, "llm_streams": 0}
+    semaphores = {}
+
+    def slots(name, size):
+        # Created on first use, inside the server's event loop
+        if name not in semaphores:
+            semaphores[name] = asyncio.Semaphore(size)
+        return semaphores[name]
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        stats["embedding_requests"] += 1
+        stats["embedding_inputs"] += len(inputs)
+        async with slots("embedding", settings.embedding_concurrency):
+            await asyncio.sleep(settings.embedding_latency + settings.embedding_item_latency * len(inputs))
+        data = [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, settings.embedding_dim).tolist()}
+            for i, text in enumerate(inputs)
+        ]
+        return Response(
+            json.dumps({"object": "list", "data": data, "model": body.get("model", "fake")}),
+            media_type="application/json"
+        )
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["llm_requests"] += 1
+        words = fake_answer(body["messages"][-1]["content"][-200:], settings.llm_answer_tokens)
+        per_token = 1.0 / settings.llm_tokens_per_sec if settings.llm_tokens_per_sec > 0 else 0.0
+
+        if not body.get("stream"):
+            async with slots("llm", settings.llm_concurrency):
+                await asyncio.sleep(settings.llm_first_token + per_token * len(words))
+            return {"choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}}]}
+
+        async def events():
+            stats["llm_streams"] += 1
+            async with slots("llm", settings.llm_concurrency):
+                await asyncio.sleep(settings.llm_first_token)
+                start = time.perf_counter()
+                for i, word in enumerate(words):
+                    # Pace against the clock so slow event loops don't drift
+                    delay = start + per_token * i - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    chunk = {"choices": [{"index": 0, "delta": {"content": word}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return {**stats, "settings": settings.as_dict()}
+
+    return app
+
+def add_arguments(parser):
+    """Fake server settings as command line options (shared with benchmarks.run)"""
+    defaults = FakeSettings()
+    for name, value in defaults.as_dict().items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+
+def settings_from_args(args):
+    return FakeSettings(**{name: getattr(args, name) for name in FakeSettings().as_dict()})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve fake embedding and LLM APIs for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    base = f"http://{args.host}:{args.port}"
+    print(f"EMBEDDING_API_URL={base}/v1/embeddings")
+    print(f"LLM_API_URL={base}/v1/chat/completions")
+    uvicorn.run(create_app(settings_from_args(args)), host=args.host, port=args.port, log_level="warning")
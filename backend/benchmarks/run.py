@@ -0,0 +1,526 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.fake_servers import add_arguments, settings_from_args
+from benchmarks.synthetic_repo import SIZES, generate_repo, make_questions
+
+# Reproducible benchmarks against local stand-ins for the embedding and LLM
+# servers (benchmarks.fake_servers):
+#   ingest  process_workspace chunks/sec on synthetic repositories
+#   search  semantic_search latency as the collection grows
+#   query   /api/query and /api/query/stream latency, p50/p99 and time to
+#           first token under concurrent load, against a real API process
+#   recall  mmap store HNSW recall@k and latency against exact search
+#   precision  recall@k and bytes per chunk of fp16/int8/truncated mmap
+#           collections against an fp32 one holding the same vectors
+# Everything runs in a scratch directory, never the configured chroma_data.
+# Results are written as JSON; --compare prints the change from an earlier
+# run, so regressions show up between commits.
+#
+# Backend modules read their configuration when imported, so they are only
+# imported once the environment points at the fake servers.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("ingest", "search", "query", "recall", "precision")
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def latency_summary(seconds):
+    """count, mean and percentiles (in milliseconds) of a list of durations"""
+    if not seconds:
+        return {"count": 0}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+def _start_process(args, env, log_path):
+    log = open(log_path, "ab")
+    return subprocess.Popen(args, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def _stop_process(process):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def _wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def _git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return commit, bool(dirty)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+## Scenarios
+async def bench_ingest(work_dir, sizes, seed):
+    from ingest import process_workspace
+
+    results = {}
+    for size in sizes:
+        files = SIZES[size] if size in SIZES else int(size)
+        root = os.path.join(work_dir, "repos", f"ingest_{size}")
+        summary = generate_repo(root, files, seed)
+        stats = await process_workspace(root, f"bench_ingest_{size}", full=True)
+        results[size] = {
+            "files": summary["files"],
+            "lines": summary["lines"],
+            "chunks": stats["chunks_inserted"],
+            "elapsed_seconds": round(stats["elapsed"], 3),
+            "chunks_per_sec": round(stats["chunks_per_sec"], 1),
+            "insert_rows_per_sec": round(stats["insert_rows_per_sec"], 1),
+            "chunk_seconds": round(stats["chunk_seconds"], 3),
+            "embed_seconds": round(stats["embed_seconds"], 3),
+            "insert_seconds": round(stats["insert_seconds"], 3),
+        }
+    return results
+
+def bench_search(sizes, queries, top_k, dim, seed):
+    """Grow one collection with random unit vectors, timing searches at each size"""
+    from milvusdb import insert_chunks, semantic_search, collection_count
+
+    repo_name = "bench_search"
+    rng = np.random.default_rng(seed)
+
+    def unit(n):
+        vectors = rng.standard_normal((n, dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    results = {}
+    inserted = 0
+    for target in sorted(sizes):
+        chunks = [
+            {"file": f"/bench/pkg_{k % 97}/module_{k // 50}.py", "start_line": k % 50 * 20 + 1,
+             "content": f"def function_{k}():\n    return {k}\n", "type": "function_definition",
+             "name": f"function_{k}"}
+            for k in range(inserted, target)
+        ]
+        start = time.perf_counter()
+        if chunks:
+            insert_chunks(chunks, unit(len(chunks)).tolist(), repo_name)
+        insert_seconds = time.perf_counter() - start
+        inserted = target
+
+        query_vectors = unit(queries).tolist()
+        # Warm up caches and any index built lazily
+        for vector in query_vectors[:3]:
+            semantic_search(vector, top_k=top_k, repo_name=repo_name)
+        seconds = []
+        for vector in query_vectors:
+            start = time.perf_counter()
+            semantic_search(vector, top_k=top_k, repo_name=repo_name)
+            seconds.append(time.perf_counter() - start)
+        results[str(target)] = {
+            "collection_size": collection_count(repo_name),
+            "insert_seconds": round(insert_seconds, 3),
+            "queries_per_sec": round(len(seconds) / sum(seconds), 1),
+            **latency_summary(seconds),
+        }
+    return results
+
+def synthetic_vectors(rng, count, dim, centers=None, spread=1.0, decay=64.0):
+    """
+    Unit vectors: unclustered Gaussian noise or, given `centers` (rows), points
+    scattered `spread` around randomly chosen centers, closer to how real
+    embeddings cluster by topic. Variance falls off across dimensions (the
+    j-th has standard deviation 1/sqrt(1 + j/decay)), as in Matryoshka-trained
+    embeddings, so leading dimensions carry most of each vector.
+    """
+    scale = 1 / np.sqrt(1 + np.arange(dim) / decay)
+    vectors = rng.standard_normal((count, dim))
+    if centers is not None:
+        vectors = centers[rng.integers(len(centers), size=count)] + spread * vectors
+    vectors = (vectors * scale).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+# Vector distributions for the store scenarios: (number of centers, spread), 0 centers for none.
+# Recall depends far more on these than on the index, so results are reported per dataset.
+VECTOR_DATASETS = {"unclustered": (0, 1.0), "clustered": (1000, 1.5)}
+
+def vector_dataset(rng, name, count, queries, dim):
+    """(vectors, query vectors) drawn from one VECTOR_DATASETS distribution"""
+    clusters, spread = VECTOR_DATASETS[name]
+    centers = rng.standard_normal((clusters, dim)) if clusters else None
+    return (
+        synthetic_vectors(rng, count, dim, centers, spread),
+        synthetic_vectors(rng, queries, dim, centers, spread),
+    )
+
+def _fill_collection(store, collection, vectors):
+    for i in range(0, len(vectors), 5000):
+        part = vectors[i:i + 5000]
+        store.upsert(
+            collection, [f"v{k}" for k in range(i, i + len(part))], part,
+            [{"file": f"/bench/module_{k // 50}.py"} for k in range(i, i + len(part))],
+            [""] * len(part)
+        )
+
+def bench_recall(work_dir, sizes, queries, top_k, dim, seed):
+    """mmap_store.measure_recall of HNSW search against exact search, fp32"""
+    from vectorstores.mmap_store import MmapStore, measure_recall
+
+    rng = np.random.default_rng(seed)
+    store = MmapStore(os.path.join(work_dir, "recall_data"), precision="fp32", truncate_dim=0, rescore_factor=0)
+    results = {}
+    for size in sizes:
+        results[str(size)] = {}
+        for dataset in VECTOR_DATASETS:
+            collection = f"recall_{dataset}_{size}"
+            vectors, query_vectors = vector_dataset(rng, dataset, size, queries, dim)
+            _fill_collection(store, collection, vectors)
+            measured = measure_recall(store, collection, query_vectors, top_k, exact=False)
+            results[str(size)][dataset] = {
+                "dim": dim,
+                "top_k": top_k,
+                "recall": round(measured["recall"], 4),
+                "hnsw_query_ms": round(measured["search_ms"], 3),
+                "exact_query_ms": round(measured["reference_ms"], 3),
+            }
+    store.close()
+    return results
+
+def parse_precision_setting(setting):
+    """(precision, truncate_dim, rescore_factor) from precision[:truncate_dim[:rescore_factor]]"""
+    precision, truncate_dim, rescore = (setting.split(":") + ["0", "0"])[:3]
+    return precision, int(truncate_dim), int(rescore)
+
+def bench_precision(work_dir, settings, size, queries, top_k, dim, seed):
+    """
+    Exact-search recall of quantized and truncated mmap collections against
+    an fp32 collection of the same vectors, and their bytes per chunk
+    """
+    from vectorstores.mmap_store import MmapStore, measure_recall
+
+    rng = np.random.default_rng(seed)
+    reference = MmapStore(os.path.join(work_dir, "precision_data", "fp32"), precision="fp32", truncate_dim=0,
+                          rescore_factor=0)
+    results = {}
+    for dataset in VECTOR_DATASETS:
+        collection = f"precision_{dataset}"
+        vectors, query_vectors = vector_dataset(rng, dataset, size, queries, dim)
+        _fill_collection(reference, collection, vectors)
+        results[dataset] = {}
+        for setting in settings:
+            precision, truncate_dim, rescore = parse_precision_setting(setting)
+            store = MmapStore(os.path.join(work_dir, "precision_data", setting.replace(":", "_")),
+                              precision=precision, truncate_dim=truncate_dim, rescore_factor=rescore)
+            _fill_collection(store, collection, vectors)
+            measured = measure_recall(store, collection, query_vectors, top_k, reference=(reference, collection),
+                                      exact=True, rescore=rescore)
+            stats = store.stats(collection)
+            results[dataset][setting] = {
+                "count": size,
+                "dim": dim,
+                "top_k": top_k,
+                "recall": round(measured["recall"], 4),
+                "query_ms": round(measured["search_ms"], 3),
+                "fp32_query_ms": round(measured["reference_ms"], 3),
+                "vector_bytes_per_chunk": stats["vector_bytes_per_chunk"],
+                "stored_bytes_per_chunk": stats["stored_bytes_per_chunk"],
+            }
+            store.close()
+    reference.close()
+    return results
+
+async def _timed_request(client, endpoint, question, repository):
+    """(latency, time to first content or None, ok) of one query"""
+    body = {"question": question, "repository": repository}
+    start = time.perf_counter()
+    if endpoint == "query":
+        response = await client.post("/api/query", json=body)
+        return time.perf_counter() - start, None, response.status_code == 200
+
+    first_token, ok = None, False
+    async with client.stream("POST", "/api/query/stream", json=body) as response:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "content" and first_token is None:
+                first_token = time.perf_counter() - start
+            elif event["type"] == "end":
+                ok = first_token is not None
+            elif event["type"] == "error":
+                break
+    return time.perf_counter() - start, first_token, ok and response.status_code == 200
+
+async def _load(base_url, endpoint, questions, concurrency, repository):
+    slots = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        async def one(question):
+            async with slots:
+                try:
+                    return await _timed_request(client, endpoint, question, repository)
+                except httpx.HTTPError:
+                    return None, None, False
+
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*[one(q) for q in questions])
+        wall = time.perf_counter() - start
+
+    latencies = [latency for latency, _, ok in outcomes if ok]
+    result = {
+        "requests": len(questions),
+        "errors": sum(1 for _, _, ok in outcomes if not ok),
+        "requests_per_sec": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency": latency_summary(latencies),
+    }
+    if endpoint == "stream":
+        result["time_to_first_token"] = latency_summary([ttft for _, ttft, ok in outcomes if ok])
+    return result
+
+def bench_query(work_dir, files, concurrency_levels, requests, seed):
+    """Ingest a repository and serve it from a separate API process, then load it"""
+    env = {**os.environ, "CHROMA_DATA_DIR": os.path.join(work_dir, "api_data")}
+    root = os.path.join(work_dir, "repos", "query")
+    generate_repo(root, files, seed)
+    repository = "bench_query"
+    log_path = os.path.join(work_dir, "api.log")
+    subprocess.run(
+        [sys.executable, "ingest.py", root, "--repository", repository, "--full"],
+        cwd=BACKEND_DIR, env=env, check=True,
+        stdout=open(log_path, "ab"), stderr=subprocess.STDOUT
+    )
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    api = _start_process(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+        env, log_path
+    )
+    results = {}
+    try:
+        _wait_until_up(base_url + "/", api)
+        # Every request asks something new, so no answer is served from a cache
+        questions = iter(make_questions(2 * len(concurrency_levels) * requests, seed))
+        for endpoint in ("query", "stream"):
+            results[endpoint] = {}
+            for concurrency in concurrency_levels:
+                batch = [next(questions) for _ in range(requests)]
+                results[endpoint][f"concurrency_{concurrency}"] = asyncio.run(
+                    _load(base_url, endpoint, batch, concurrency, repository)
+                )
+    finally:
+        _stop_process(api)
+    return results
+
+## Comparing runs
+def _numbers(tree, prefix=""):
+    """Flatten the numeric leaves of nested dicts into {"a.b.c": value}"""
+    flat = {}
+    for key, value in tree.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_numbers(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+def _higher_is_better(path):
+    return path.endswith(("per_sec", "recall"))
+
+def _lower_is_better(path):
+    return path.endswith(("_ms", "_seconds"))
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    Lines describing how each timing or throughput changed from baseline.
+    Changes for the worse beyond `threshold` (a fraction) are flagged.
+    """
+    old, new = _numbers(baseline["scenarios"]), _numbers(current["scenarios"])
+    lines = []
+    for path in sorted(set(old) & set(new)):
+        if not (_higher_is_better(path) or _lower_is_better(path)) or not old[path]:
+            continue
+        change = (new[path] - old[path]) / old[path]
+        worse = change < -threshold if _higher_is_better(path) else change > threshold
+        flag = "  REGRESSION" if worse else ""
+        lines.append(f"{path}: {old[path]:g} -> {new[path]:g} ({change:+.1%}){flag}")
+    return lines
+
+## Command line
+def _fake_server_args(settings):
+    args = []
+    for name, value in settings.as_dict().items():
+        args += [f"--{name.replace('_', '-')}", str(value)]
+    return args
+
+def _csv(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Run AskHim benchmarks against local fake servers")
+    parser.add_argument("--scenarios", type=_csv, default=list(SCENARIOS),
+                        help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--ingest-sizes", type=_csv, default=["small", "medium"],
+                        help=f"Repository sizes to ingest: {', '.join(SIZES)} or file counts")
+    parser.add_argument("--search-sizes", type=_csv, default=["1000", "10000", "50000"],
+                        help="Collection sizes (chunks) to time searches at")
+    parser.add_argument("--search-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--recall-sizes", type=_csv, default=["30000"],
+                        help="Collection sizes (vectors) to measure HNSW recall at")
+    parser.add_argument("--recall-dim", type=int, default=256)
+    parser.add_argument("--recall-queries", type=int, default=200)
+    parser.add_argument("--recall-top-k", type=int, default=10)
+    parser.add_argument("--precision-settings", type=_csv, default=["fp16", "int8", "int8:256", "int8:256:4"],
+                        help="mmap layouts to compare with fp32, as precision[:truncate_dim[:rescore_factor]]")
+    parser.add_argument("--precision-size", type=int, default=20000)
+    parser.add_argument("--precision-dim", type=int, default=768)
+    parser.add_argument("--query-files", type=int, default=SIZES["small"] * 2,
+                        help="Files in the repository served for the query scenario")
+    parser.add_argument("--concurrency", type=_csv, default=["1", "8", "32"])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Results file (default: benchmark-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--work-dir", help="Scratch directory (default: a temporary one, removed afterwards)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    settings = settings_from_args(args)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="askhim-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+
+    port = _free_port()
+    fake_url = f"http://127.0.0.1:{port}"
+    fake = _start_process(
+        [sys.executable, "-m", "benchmarks.fake_servers", "--port", str(port), *_fake_server_args(settings)],
+        dict(os.environ), os.path.join(work_dir, "fake_servers.log")
+    )
+    os.environ.update({
+        "EMBEDDING_API_URL": f"{fake_url}/v1/embeddings",
+        "LLM_API_URL": f"{fake_url}/v1/chat/completions",
+        "EMBEDDING_DIM": str(settings.embedding_dim),
+        "CHROMA_DATA_DIR": os.path.join(work_dir, "data"),
+    })
+    # Measure the uncached paths unless told otherwise
+    os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+    os.environ.setdefault("ANSWER_CACHE_TTL", "0")
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+    commit, dirty = _git_commit()
+    results = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "settings": {
+            "fake_servers": settings.as_dict(),
+            "seed": args.seed,
+            "env": {
+                name: os.environ.get(name)
+                for name in ("VECTOR_STORE", "VECTOR_PRECISION", "EMBEDDING_TRUNCATE_DIM", "HYBRID_SEARCH",
+                             "EMBEDDING_BATCH_SIZE", "EMBEDDING_CONCURRENCY", "CHUNK_WORKERS",
+                             "EMBEDDING_CACHE_PATH", "ANSWER_CACHE_TTL", "HNSW_M", "HNSW_EF_CONSTRUCTION",
+                             "HNSW_EF_SEARCH")
+            },
+            "vector_datasets": {
+                name: {"centers": clusters, "spread": spread} for name, (clusters, spread) in VECTOR_DATASETS.items()
+            },
+        },
+        "scenarios": {},
+    }
+    try:
+        _wait_until_up(f"{fake_url}/stats", fake)
+        if "ingest" in args.scenarios:
+            print(f"Ingest: {', '.join(args.ingest_sizes)}")
+            results["scenarios"]["ingest"] = asyncio.run(bench_ingest(work_dir, args.ingest_sizes, args.seed))
+        if "search" in args.scenarios:
+            print(f"Search: {', '.join(args.search_sizes)} chunks")
+            results["scenarios"]["search"] = bench_search(
+                [int(s) for s in args.search_sizes], args.search_queries, args.top_k,
+                settings.embedding_dim, args.seed
+            )
+        if "query" in args.scenarios:
+            print(f"Query: concurrency {', '.join(args.concurrency)}")
+            results["scenarios"]["query"] = bench_query(
+                work_dir, args.query_files, [int(c) for c in args.concurrency], args.requests, args.seed
+            )
+        if "recall" in args.scenarios:
+            print(f"Recall: {', '.join(args.recall_sizes)} vectors")
+            results["scenarios"]["recall"] = bench_recall(
+                work_dir, [int(s) for s in args.recall_sizes], args.recall_queries, args.recall_top_k,
+                args.recall_dim, args.seed
+            )
+        if "precision" in args.scenarios:
+            print(f"Precision: {', '.join(args.precision_settings)} against fp32")
+            results["scenarios"]["precision"] = bench_precision(
+                work_dir, args.precision_settings, args.precision_size, args.recall_queries, args.recall_top_k,
+                args.precision_dim, args.seed
+            )
+    finally:
+        _stop_process(fake)
+        if "ingest" in args.scenarios or "search" in args.scenarios:
+            from executors import shutdown_executors
+            from chunker import shutdown_chunk_pool
+            shutdown_executors()
+            shutdown_chunk_pool()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    out = args.out or f"benchmark-{(commit or 'nocommit')[:10]}.json"
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["scenarios"], indent=2))
+    print(f"Results written to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} ({(baseline['meta'].get('commit') or '?')[:10]}):")
+        for line in compare_results(baseline, results):
+            print(f"  {line}")
+
+if __name__ == "__main__":
+    main()
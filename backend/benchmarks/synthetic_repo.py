@@ -0,0 +1,112 @@
+import argparse
+import os
+import random
+
+# Synthetic Python repositories for benchmarks.
+# Files are spread over nested packages and hold classes and functions built
+# from a fixed vocabulary, so the chunker, lexical index and embeddings see
+# realistic-looking code. The same seed and size always produce the same
+# tree, byte for byte.
+
+VERBS = [
+    "load", "save", "parse", "render", "validate", "fetch", "merge", "split", "resolve",
+    "encode", "decode", "schedule", "retry", "cache", "index", "sync", "export", "import",
+]
+NOUNS = [
+    "invoice", "customer", "order", "payment", "session", "token", "report", "account",
+    "shipment", "product", "ledger", "user", "config", "record", "message", "batch",
+    "queue", "snapshot", "permission", "webhook",
+]
+QUALIFIERS = ["pending", "cached", "remote", "local", "archived", "draft", "signed", "partial"]
+
+# files per size preset
+SIZES = {"small": 50, "medium": 500, "large": 5000}
+
+def _function(rng, name, indent=""):
+    noun = rng.choice(NOUNS)
+    args = ", ".join(rng.sample(["items", "limit", "client", "strict", "timeout", "path"], rng.randint(1, 3)))
+    lines = [
+        f"{indent}def {name}({'self, ' if indent else ''}{args}):",
+        f'{indent}    """{name.replace("_", " ").capitalize()} for every {rng.choice(QUALIFIERS)} {noun}."""',
+        f"{indent}    results = []",
+    ]
+    for _ in range(rng.randint(3, 12)):
+        other = f"{rng.choice(VERBS)}_{rng.choice(NOUNS)}"
+        lines += [
+            f"{indent}    for {noun} in {rng.choice(['items', 'results', 'pending'])}:",
+            f"{indent}        if {noun} is None or not {other}({noun}):",
+            f"{indent}            continue",
+            f"{indent}        results.append({{'{noun}': {noun}, 'step': {rng.randint(1, 99)}}})",
+        ]
+    lines.append(f"{indent}    return results")
+    return lines
+
+def _class(rng, name):
+    lines = [
+        f"class {name}:",
+        f'    """Keeps {rng.choice(QUALIFIERS)} {rng.choice(NOUNS)} state in sync."""',
+        "",
+        "    def __init__(self, client=None):",
+        "        self.client = client",
+        "        self.entries = {}",
+    ]
+    for _ in range(rng.randint(2, 5)):
+        lines.append("")
+        lines += _function(rng, f"{rng.choice(VERBS)}_{rng.choice(NOUNS)}", indent="    ")
+    return lines
+
+def generate_repo(root, files=SIZES["small"], seed=0):
+    """
+    Write `files` Python modules under root and return a summary: counts of
+    files, functions, classes, lines and bytes, plus "names" of the top-level
+    functions (for building questions).
+    """
+    rng = random.Random(seed)
+    summary = {"files": 0, "functions": 0, "classes": 0, "lines": 0, "bytes": 0, "names": []}
+    for i in range(files):
+        package = os.path.join(root, f"pkg_{i % 10}", f"sub_{(i // 10) % 5}")
+        os.makedirs(package, exist_ok=True)
+        lines = ["import os", "import json", ""]
+        for _ in range(rng.randint(2, 6)):
+            name = f"{rng.choice(VERBS)}_{rng.choice(QUALIFIERS)}_{rng.choice(NOUNS)}"
+            lines += [""] + _function(rng, name) + [""]
+            summary["functions"] += 1
+            summary["names"].append(name)
+        for _ in range(rng.randint(0, 2)):
+            name = "".join(w.capitalize() for w in (rng.choice(QUALIFIERS), rng.choice(NOUNS), "Manager"))
+            lines += [""] + _class(rng, name) + [""]
+            summary["classes"] += 1
+        text = "\n".join(lines) + "\n"
+        with open(os.path.join(package, f"module_{i}.py"), "w") as f:
+            f.write(text)
+        summary["files"] += 1
+        summary["lines"] += len(lines)
+        summary["bytes"] += len(text.encode())
+    return summary
+
+def make_questions(count, seed=0):
+    """Natural-language questions over the generated vocabulary, none naming a symbol exactly"""
+    rng = random.Random(seed)
+    templates = [
+        "How do we {verb} {qualifier} {noun} records?",
+        "Where is the {noun} {verb} step handled?",
+        "What happens to a {qualifier} {noun} when we {verb} it?",
+        "Which code is responsible for {verb}ing each {noun}?",
+    ]
+    return [
+        rng.choice(templates).format(verb=rng.choice(VERBS), noun=rng.choice(NOUNS), qualifier=rng.choice(QUALIFIERS))
+        + f" (#{i})"
+        for i in range(count)
+    ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Python repository")
+    parser.add_argument("root", help="Directory to write the repository into")
+    parser.add_argument("--size", default="small", help=f"{', '.join(SIZES)} or a number of files")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    files = SIZES[args.size] if args.size in SIZES else int(args.size)
+    summary = generate_repo(args.root, files, args.seed)
+    print(f"Wrote {summary['files']} files ({summary['functions']} functions, {summary['classes']} classes, "
+          f"{summary['lines']} lines) to {args.root}")
@@ -1,11 +1,24 @@
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from tree_sitter import Language, Parser
-# Load the compiled language
+from config import CHUNK_WORKERS, CHUNK_FILES_PER_TASK, CHUNK_MAX_TOKENS
+from tokens import count_tokens
+# Load the compiled language (once per process, including pool workers)
 PY_LANGUAGE = Language('build/my-languages.so', 'python')
 
-# Initialize the parser with the Python language
-parser = Parser()
-parser.set_language(PY_LANGUAGE)
+# Parsers are not thread-safe, so each thread gets its own and reuses it
+_local = threading.local()
+
+def get_parser():
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = Parser()
+        parser.set_language(PY_LANGUAGE)
+        _local.parser = parser
+    return parser
 
 # def extract_chunks(code: str):
 #     tree = parser.parse(bytes(code, "utf8"))
@@ -44,35 +57,226 @@ parser.set_language(PY_LANGUAGE)
 #     parse_directory(sys.argv[1])
     
 ## Function to chunk Python code by functions and classes
-def chunk_python_by_functions_and_classes(file_path):
-    parser = Parser()
-    parser.set_language(PY_LANGUAGE)
+# Every line of a definition belongs to exactly one chunk: a class becomes a
+# skeleton chunk (its own statements, with method and nested class bodies
+# elided to "...") plus one chunk per method, each pointing at its enclosing
+# class through the "parent" field. Nested functions stay inside the chunk of
+# the function that defines them. Anything longer than CHUNK_MAX_TOKENS is
+# split at line boundaries into numbered parts.
+DEFINITION_TYPES = ("function_definition", "class_definition")
+
+def _definition_of(node):
+    """The function/class node for a definition, unwrapping decorators"""
+    if node.type == "decorated_definition":
+        return node.child_by_field_name("definition")
+    return node
+
+def _node_name(node, code):
+    name = node.child_by_field_name("name")
+    return code[name.start_byte:name.end_byte].decode("utf-8", errors="replace") if name else None
+
+def _class_skeleton(outer, definition, code):
+    """
+    Source of a class with the bodies of its direct definitions elided, and
+    the source line number of each of its lines
+    """
+    body = definition.child_by_field_name("body")
+    parts = []  # (bytes, source line of the first byte)
+    cursor, cursor_line = outer.start_byte, outer.start_point[0] + 1
+    for child in body.children if body else []:
+        inner = _definition_of(child)
+        if inner is None or inner.type not in DEFINITION_TYPES:
+            continue
+        inner_body = inner.child_by_field_name("body")
+        if inner_body is None:
+            continue
+        parts.append((code[cursor:inner_body.start_byte], cursor_line))
+        parts.append((b"...", inner_body.start_point[0] + 1))
+        cursor, cursor_line = inner_body.end_byte, inner_body.end_point[0] + 1
+    parts.append((code[cursor:outer.end_byte], cursor_line))
+    # A part continues the current line; each newline in it starts the next
+    line_numbers = [outer.start_point[0] + 1]
+    for text, line in parts:
+        line_numbers.extend(line + 1 + i for i in range(text.count(b"\n")))
+    return b"".join(text for text, _ in parts).decode("utf-8", errors="replace"), line_numbers
+
+def split_to_token_budget(chunk, max_tokens=CHUNK_MAX_TOKENS, line_numbers=None):
+    """
+    Split a chunk at line boundaries into parts of at most max_tokens.
+    line_numbers gives the source line of each content line, for content
+    that is not a contiguous slice of the file (class skeletons).
+    """
+    if count_tokens(chunk["content"]) <= max_tokens:
+        return [chunk]
+    parts = []
+    lines = chunk["content"].splitlines(keepends=True)
+    piece, piece_tokens, piece_start = [], 0, 0
+    for i, line in enumerate(lines):
+        line_tokens = count_tokens(line)
+        if piece and piece_tokens + line_tokens > max_tokens:
+            parts.append((piece_start, piece))
+            piece, piece_tokens, piece_start = [], 0, i
+        piece.append(line)
+        piece_tokens += line_tokens
+    if piece:
+        parts.append((piece_start, piece))
+    if line_numbers is None:
+        line_numbers = range(chunk["start_line"], chunk["start_line"] + len(lines))
+    return [
+        {
+            **chunk,
+            "content": "".join(piece),
+            "start_line": line_numbers[offset],
+            "end_line": line_numbers[offset + len(piece) - 1],
+            "part": number,
+        }
+        for number, (offset, piece) in enumerate(parts, start=1)
+    ]
+
+def chunk_python_by_functions_and_classes(file_path, max_tokens=CHUNK_MAX_TOKENS):
+    parser = get_parser()
     
     with open(file_path, "rb") as f:
         code = f.read()
         
     tree = parser.parse(code)
-    root = tree.root_node
-
-    def dfs(node, code):
-        results = []
-        if node.type in ["function_definition", "class_definition"]:
-            start_byte, end_byte = node.start_byte, node.end_byte
-            start_line = node.start_point[0] + 1
-            name = None
-            for child in node.children:
-                if child.type == "identifier":
-                    name = code[child.start_byte:child.end_byte].decode()
-            results.append({
-                "content": code[start_byte:end_byte].decode(),
-                "type": node.type,
+    cursor = tree.walk()
+    results = []
+    classes = []  # (depth, qualified name) of the classes we are inside
+    depth = 0
+
+    # Single pre-order pass with a tree cursor: no recursion, no list copies
+    while True:
+        node = cursor.node
+        descend = True
+        definition = _definition_of(node)
+        if definition is not None and definition.type in DEFINITION_TYPES and (
+            node.type == "decorated_definition" or node.parent is None
+            or node.parent.type != "decorated_definition"
+        ):
+            name = _node_name(definition, code)
+            parent = classes[-1][1] if classes else ""
+            chunk = {
+                "type": definition.type,
                 "name": name,
+                "parent": parent,
                 "file": file_path,
-                "start_line": start_line,
-            })
-        for child in node.children:
-            results += dfs(child, code)
-        return results
+                "start_line": node.start_point[0] + 1,
+                "end_line": node.end_point[0] + 1,
+                "part": 0,
+            }
+            line_numbers = None
+            if definition.type == "class_definition":
+                chunk["content"], line_numbers = _class_skeleton(node, definition, code)
+                qualified = f"{parent}.{name}" if parent else name
+                classes.append((depth, qualified))
+            else:
+                chunk["content"] = code[node.start_byte:node.end_byte].decode("utf-8", errors="replace")
+                descend = False
+            results.extend(split_to_token_budget(chunk, max_tokens, line_numbers))
+
+        if descend and cursor.goto_first_child():
+            depth += 1
+            continue
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return results
+            depth -= 1
+            if classes and classes[-1][0] == depth:
+                classes.pop()
+
+def is_chunkable(file_path):
+    """Whether chunk_source_file has a parser for this file"""
+    return file_path.endswith('.py')
+
+def chunk_source_file(file_path):
+    """Chunk a file with the parser for its language"""
+    if file_path.endswith('.py'):
+        return chunk_python_by_functions_and_classes(file_path)
+    return []
+
+## Parallel chunking across a process pool
+_pool = None
+
+def _init_worker():
+    # Build the worker's parser up front so every task reuses it
+    get_parser()
+
+def _chunk_files_task(file_paths):
+    """Runs in a pool worker: chunk a group of files, reporting errors and parse time per file"""
+    results = []
+    for file_path in file_paths:
+        start = time.perf_counter()
+        try:
+            chunks, error = chunk_source_file(file_path), None
+        except Exception as e:
+            chunks, error = [], f"{type(e).__name__}: {e}"
+        results.append((file_path, chunks, error, time.perf_counter() - start))
+    return results
+
+def get_chunk_pool():
+    """Process pool shared by every parallel chunking call in this process"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=CHUNK_WORKERS, initializer=_init_worker)
+    return _pool
+
+def shutdown_chunk_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+async def _as_async_iter(items):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+async def chunk_files_parallel(file_paths, files_per_task=CHUNK_FILES_PER_TASK):
+    """
+    Chunk files across the process pool, yielding (file_path, chunks, error,
+    seconds spent parsing) as each group of files finishes, in completion order. `file_paths` may be
+    a plain or an async iterable (e.g. fed by a scanner). At most a few
+    groups per worker are in flight, so huge file lists are never submitted
+    all at once.
+    """
+    loop = asyncio.get_running_loop()
+    file_paths = _as_async_iter(file_paths)
+    if CHUNK_WORKERS <= 1:
+        # No pool: still keep parsing off the event loop
+        async for file_path in file_paths:
+            yield await loop.run_in_executor(None, lambda p=file_path: _chunk_files_task([p])[0])
+        return
+
+    pool = get_chunk_pool()
+    max_in_flight = CHUNK_WORKERS * 2
+    pending = set()
+    exhausted = False
 
-    return dfs(root, code)
+    async def submit_next():
+        nonlocal exhausted
+        group = []
+        while not exhausted and len(group) < files_per_task:
+            try:
+                group.append(await file_paths.__anext__())
+            except StopAsyncIteration:
+                exhausted = True
+        if group:
+            pending.add(asyncio.wrap_future(pool.submit(_chunk_files_task, group)))
 
+    try:
+        while not exhausted and len(pending) < max_in_flight:
+            await submit_next()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                for result in future.result():
+                    yield result
+                await submit_next()
+    finally:
+        for future in pending:
+            future.cancel()
@@ -7,3 +7,106 @@ WORKSPACE_DIR = os.getenv("WORKSPACE_DIR")
 EMBEDDING_API_URL = os.getenv("EMBEDDING_API_URL")
 LLM_API_URL = os.getenv("LLM_API_URL")
 EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 768))
+
+# Ingest-time embedding: chunks per request, requests in flight, retries per batch
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 3))
+
+# Persistent embedding cache; set EMBEDDING_CACHE_PATH to an empty string to disable it
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+
+# Tree-sitter parsing runs in a process pool; files are sent to workers in small groups
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", os.cpu_count() or 1))
+CHUNK_FILES_PER_TASK = int(os.getenv("CHUNK_FILES_PER_TASK", 8))
+
+# Streaming ingest: files buffered between pipeline stages, seconds between manifest checkpoints
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 64))
+MANIFEST_SAVE_INTERVAL = float(os.getenv("MANIFEST_SAVE_INTERVAL", 5))
+
+# Definitions longer than this (estimated tokens) are split into several chunks
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 800))
+
+# Upper bound on rows per Chroma upsert call (the client's own limit also applies)
+CHROMA_INSERT_BATCH_SIZE = int(os.getenv("CHROMA_INSERT_BATCH_SIZE", 4096))
+
+# Watch mode: wait this long (ms) for a burst of saves to settle; poll instead of inotify if set
+WATCH_DEBOUNCE_MS = int(os.getenv("WATCH_DEBOUNCE_MS", 1600))
+WATCH_STEP_MS = int(os.getenv("WATCH_STEP_MS", 300))
+WATCH_FORCE_POLLING = os.getenv("WATCH_FORCE_POLLING", "").lower() in ("1", "true", "yes")
+
+# Workspace scanning: skip files larger than this, list directories on this many threads
+SCAN_MAX_FILE_BYTES = int(os.getenv("SCAN_MAX_FILE_BYTES", 1024 * 1024))
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", 4))
+# Extra ignore file, same syntax as .gitignore, honoured at every directory level
+PROJECT_IGNORE_FILE = os.getenv("PROJECT_IGNORE_FILE", ".askhimignore")
+
+# Shared HTTP connection pools for the embedding and LLM servers
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "").lower() in ("1", "true", "yes")
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", 600))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 120))
+
+# Blocking Chroma work runs on thread pools: vector searches on one, ingest writes on another
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", 8))
+INGEST_IO_WORKERS = int(os.getenv("INGEST_IO_WORKERS", 1))
+
+# Query caches: question embeddings (LRU), answers (LRU with a TTL in seconds, 0 disables),
+# and an optional cosine similarity at which a near-duplicate question reuses an answer (0 disables)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 1024))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 512))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0))
+
+# Hybrid retrieval: BM25 over names, paths and code tokens, fused with vector hits by
+# reciprocal rank fusion; a question naming a known symbol can skip the embedding call
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+RRF_K = int(os.getenv("RRF_K", 60))
+SYMBOL_SKIPS_EMBEDDING = os.getenv("SYMBOL_SKIPS_EMBEDDING", "true").lower() in ("1", "true", "yes")
+
+# Cross-repository search: seconds to wait for each collection before leaving it out
+FANOUT_SEARCH_TIMEOUT = float(os.getenv("FANOUT_SEARCH_TIMEOUT", 5))
+
+# Tokens of retrieved code allowed in a prompt; per-template overrides as "template=tokens,..."
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+CONTEXT_TOKEN_BUDGETS = {
+    name.strip(): int(tokens)
+    for name, _, tokens in (
+        item.partition("=") for item in os.getenv("CONTEXT_TOKEN_BUDGETS", "").split(",")
+    )
+    if tokens.strip()
+}
+
+# Seconds a non-streaming query may take before it is cancelled with a 504 (0 disables),
+# and how often a request is checked for a client that has gone away
+QUERY_TIMEOUT = float(os.getenv("QUERY_TIMEOUT", 120))
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", 0.5))
+
+# Batch queries: questions retrieved together (one embedding call, one vector query),
+# and LLM calls in flight per batch request
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", 64))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", 4))
+
+# Where vectors, manifests and lexical indexes are kept (default: chroma_data/ in the project root)
+CHROMA_DATA_DIR = os.getenv("CHROMA_DATA_DIR", "")
+
+# Vector store backend: "chroma", or "mmap" (memory-mapped NumPy vectors with a SQLite metadata
+# table). mmap searches exactly up to MMAP_EXACT_SEARCH_LIMIT chunks and through an HNSW index above
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+MMAP_EXACT_SEARCH_LIMIT = int(os.getenv("MMAP_EXACT_SEARCH_LIMIT", 20000))
+HNSW_M = int(os.getenv("HNSW_M", 16))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", 200))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 64))
+MMAP_INDEX_SAVE_INTERVAL = float(os.getenv("MMAP_INDEX_SAVE_INTERVAL", 60))
+
+# Vector size: keep the first EMBEDDING_TRUNCATE_DIM dimensions of each embedding (Matryoshka
+# truncation; 0 keeps all) and, in the mmap store, store them as fp32, fp16 or int8. With a
+# VECTOR_RESCORE_FACTOR > 0 the mmap store also keeps full-precision vectors on disk and
+# re-ranks that many times top_k candidates with them. New collections only
+EMBEDDING_TRUNCATE_DIM = int(os.getenv("EMBEDDING_TRUNCATE_DIM", 0))
+VECTOR_PRECISION = os.getenv("VECTOR_PRECISION", "fp32")
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", 0))
@@ -0,0 +1,91 @@
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_TOKEN_BUDGETS
+from tokens import count_tokens
+
+# Fits retrieved chunks into a prompt's context budget.
+# Hits are taken in rank order. A hit whose lines are already covered by a
+# better-ranked hit from the same file is dropped. A chunk that does not fit
+# is cut at a line boundary with an elision marker, so the most relevant
+# code always makes it in, at least in part.
+
+# No chunk may take more than this share of the budget, so one huge class
+# cannot crowd out every other hit
+MAX_CHUNK_SHARE = 0.5
+# Don't bother adding a chunk trimmed to less than this
+MIN_CHUNK_TOKENS = 48
+
+def context_budget(template_name):
+    return CONTEXT_TOKEN_BUDGETS.get(template_name, CONTEXT_TOKEN_BUDGET)
+
+def _line_range(hit):
+    start = hit.get("start_line") or 0
+    return start, max(hit.get("end_line") or start, start)
+
+def _is_redundant(hit, kept):
+    """True if an already kept hit from the same file covers this one's lines"""
+    start, end = _line_range(hit)
+    for other in kept:
+        if other["file"] != hit["file"]:
+            continue
+        other_start, other_end = _line_range(other)
+        if (other_start, other_end) == (start, end):
+            return True
+        if other.get("type") == "class_definition":
+            # Class chunks are skeletons with the bodies of methods and nested
+            # classes elided; their own chunks are not repeats
+            continue
+        if other_start <= start and end <= other_end:
+            return True
+    return False
+
+def trim_to_tokens(text, max_tokens):
+    """Cut text at a line boundary to at most max_tokens, noting what was left out"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    lines = text.splitlines(keepends=True)
+    # Leave room for the "... (N more lines)" marker
+    limit = max_tokens - count_tokens(f"... ({len(lines)} more lines)")
+    kept, used = [], 0
+    for line in lines:
+        line_tokens = count_tokens(line)
+        if used + line_tokens > limit:
+            break
+        kept.append(line)
+        used += line_tokens
+    elided = lines[len(kept):]
+    indent = elided[0][:len(elided[0]) - len(elided[0].lstrip())]
+    if kept and not kept[-1].endswith("\n"):
+        kept.append("\n")
+    kept.append(f"{indent}... ({len(elided)} more lines)")
+    return "".join(kept)
+
+def pack_context(hits, format_hit, budget, separator="\n\n"):
+    """
+    Pack hits into at most `budget` tokens. `format_hit(hit)` renders one hit,
+    header included. Returns (context, tokens used, the hits that made it in,
+    with "content" trimmed where needed).
+    """
+    packed, parts = [], []
+    used = 0
+    separator_tokens = count_tokens(separator)
+    for hit in hits:
+        if _is_redundant(hit, packed):
+            continue
+        remaining = budget - used - (separator_tokens if parts else 0)
+        if remaining < MIN_CHUNK_TOKENS:
+            break
+        text = format_hit(hit)
+        tokens = count_tokens(text)
+        allowed = min(remaining, int(budget * MAX_CHUNK_SHARE)) if len(hits) > 1 else remaining
+        if tokens > allowed:
+            overhead = count_tokens(format_hit({**hit, "content": ""}))
+            if allowed - overhead < MIN_CHUNK_TOKENS:
+                continue
+            hit = {**hit, "content": trim_to_tokens(hit["content"], allowed - overhead)}
+            text = format_hit(hit)
+            tokens = count_tokens(text)
+        if parts:
+            used += separator_tokens
+        packed.append(hit)
+        parts.append(text)
+        used += tokens
+    return separator.join(parts), used, packed
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+# Disk-backed, content-addressed cache of embedding vectors.
+# Entries are keyed by a hash of (model name, prefix, text), so byte-identical
+# chunks are only embedded once across re-ingests. The store is a SQLite
+# database in WAL mode, which lets several threads and processes read and
+# write it at the same time. When it grows past `max_entries` the least
+# recently used rows are evicted.
+
+class EmbeddingCache:
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        conn.commit()
+        self._entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _connection(self):
+        """One connection per thread; SQLite handles cross-connection locking"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model, prefix, text):
+        digest = hashlib.sha256()
+        for part in (model, prefix, text):
+            digest.update(part.encode("utf-8", errors="surrogatepass"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get_many(self, keys):
+        """Return a dict of key -> embedding for the keys that are cached"""
+        if not keys:
+            return {}
+        conn = self._connection()
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay well under SQLite's bound-parameter limit
+        for i in range(0, len(unique_keys), 500):
+            part = unique_keys[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                part,
+            ).fetchall()
+            for key, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[key] = vector.tolist()
+        if found:
+            now = time.time()
+            conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            conn.commit()
+        hits = sum(1 for key in keys if key in found)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items):
+        """Store (key, embedding) pairs, then evict if over capacity"""
+        if not items:
+            return
+        conn = self._connection()
+        now = time.time()
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [(key, array("f", emb).tobytes(), now) for key, emb in items],
+        )
+        conn.commit()
+        with self._lock:
+            self._entries += conn.total_changes - before
+            over_capacity = self._entries > self.max_entries
+        if over_capacity:
+            self._evict()
+
+    def put(self, key, embedding):
+        self.put_many([(key, embedding)])
+
+    def _evict(self):
+        conn = self._connection()
+        # Re-count: other processes may have inserted or evicted too
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            conn.commit()
+            count -= excess
+        with self._lock:
+            self._entries = count
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": self._entries,
+                "max_entries": self.max_entries,
+            }
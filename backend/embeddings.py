@@ -1,14 +1,30 @@
-import httpx
+import asyncio
 import json
 import os
 import requests
-from config import EMBEDDING_API_URL
+from config import (
+    EMBEDDING_API_URL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+)
+from embedding_cache import EmbeddingCache
+from http_clients import get_embedding_client
 
 # This module provides functions to interact with an embedding API.
 # It allows you to get embeddings for a single text or a list of texts.
 # Make sure to set the EMBEDDING_API_URL in your config.py file.
 MODEL_NAME = "nomic-ai/nomic-embed-text-v1.5"
-CACHE_PATH = "./embedding_api_cache.log"
+QUERY_PREFIX = "search_query: "
+CACHE_PATH = EMBEDDING_CACHE_PATH
+
+# Both the sync and async paths look vectors up here before calling the API
+embedding_cache = (
+    EmbeddingCache(CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+    if CACHE_PATH else None
+)
 
 class ForwardedHTTPException(Exception):
     def __init__(self, source, forwarded_by, response):
@@ -17,85 +33,160 @@ class ForwardedHTTPException(Exception):
         self.response = response
         super().__init__(f"ForwardedHTTPException from {source} by {forwarded_by}: {response.text}")
 
+def get_cache_stats():
+    """Hit/miss counters for the persistent embedding cache"""
+    if embedding_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_cache.stats()}
+
+def _cache_keys(list_of_texts):
+    return [
+        EmbeddingCache.make_key(MODEL_NAME, QUERY_PREFIX, t)
+        for t in list_of_texts
+    ]
+
+def _cached_lookup(list_of_texts):
+    """Return (keys, cached vectors by key, indices of texts still to embed)"""
+    if embedding_cache is None:
+        return None, {}, list(range(len(list_of_texts)))
+    keys = _cache_keys(list_of_texts)
+    cached = embedding_cache.get_many(keys)
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    return keys, cached, missing
+
+def _merge_embeddings(keys, cached, missing, fetched):
+    """Store freshly fetched vectors and assemble the full result in order"""
+    if len(fetched) != len(missing):
+        raise ValueError(f"Expected {len(missing)} embeddings, got {len(fetched)}")
+    if embedding_cache is None:
+        return fetched
+    embedding_cache.put_many([(keys[i], emb) for i, emb in zip(missing, fetched)])
+    for i, emb in zip(missing, fetched):
+        cached[keys[i]] = emb
+    return [cached[key] for key in keys]
+
+def _parse_embeddings(response_body):
+    if "embeddings" in response_body:
+        return response_body["embeddings"]
+    elif "data" in response_body and response_body["data"]:
+        return [item["embedding"] for item in response_body["data"]]
+    else:
+        raise KeyError(f"Embeddings not found in response: {response_body}")
+
 def get_embedding(text):
+    keys, cached, missing = _cached_lookup([text])
+    if not missing:
+        return cached[keys[0]]
     payload = {
-        "input": f"search_query: {text}",
+        "input": f"{QUERY_PREFIX}{text}",
         "model": MODEL_NAME,
         "input_type": "query"
     }
     resp = requests.post(EMBEDDING_API_URL, json=payload)
-    response_body = resp.json()
-    if "embeddings" in response_body:
-        emb = response_body["embeddings"][0]
-    elif "data" in response_body and response_body["data"]:
-        emb = response_body["data"][0]["embedding"]
-    else:
-        raise KeyError(f"Embedding not found in response: {response_body}")
-    return emb  # Should be a list of floats
+    emb = _parse_embeddings(resp.json())[0]  # Should be a list of floats
+    return _merge_embeddings(keys, cached, missing, [emb])[0]
 
 def get_embeddings(list_of_texts):
+    keys, cached, missing = _cached_lookup(list_of_texts)
+    if not missing:
+        return [cached[key] for key in keys]
     payload = {
-        "input": [f"search_query: {t}" for t in list_of_texts],
+        "input": [f"{QUERY_PREFIX}{list_of_texts[i]}" for i in missing],
         "model": MODEL_NAME,
         "input_type": "query"
     }
     resp = requests.post(EMBEDDING_API_URL, json=payload)
-    response_body = resp.json()
-    if "embeddings" in response_body:
-        return response_body["embeddings"]
-    elif "data" in response_body and response_body["data"]:
-        return [item["embedding"] for item in response_body["data"]]
-    else:
-        raise KeyError(f"Embeddings not found in response: {response_body}")
+    fetched = _parse_embeddings(resp.json())
+    return _merge_embeddings(keys, cached, missing, fetched)
 
 async def get_embedding(text):
+    # The cache is SQLite: keep its reads and writes off the event loop
+    keys, cached, missing = await asyncio.to_thread(_cached_lookup, [text])
+    if not missing:
+        return cached[keys[0]]
     payload = {
-        "input": f"search_query: {text}",
+        "input": f"{QUERY_PREFIX}{text}",
         "model": MODEL_NAME,
         "input_type": "query"
     }
-    async with httpx.AsyncClient(timeout=600) as client:
-        response = await client.post(EMBEDDING_API_URL, json=payload)
-        # print(response)
-        if response.status_code != 200:
-            print(f"Failed to get response from {EMBEDDING_API_URL}:", response.text)
-            raise ForwardedHTTPException(
-                source="get_embedding",
-                forwarded_by="embeddings.get_embedding",
-                response=response,
-            )
-        response_body = response.json()
-        # with open(CACHE_PATH, "a") as f:
-        #     f.write(json.dumps({"payload": payload, "response": response_body}) + "\n")
-        if "embeddings" in response_body:
-            emb = response_body["embeddings"][0]
-        elif "data" in response_body and response_body["data"]:
-            emb = response_body["data"][0]["embedding"]
-        else:
-            raise KeyError(f"Embedding not found in response: {response_body}")
-        return emb
+    client = get_embedding_client()
+    response = await client.post(EMBEDDING_API_URL, json=payload)
+    # print(response)
+    if response.status_code != 200:
+        print(f"Failed to get response from {EMBEDDING_API_URL}:", response.text)
+        raise ForwardedHTTPException(
+            source="get_embedding",
+            forwarded_by="embeddings.get_embedding",
+            response=response,
+        )
+    emb = _parse_embeddings(response.json())[0]
+    return (await asyncio.to_thread(_merge_embeddings, keys, cached, missing, [emb]))[0]
 
 async def get_embeddings(list_of_texts):
+    keys, cached, missing = await asyncio.to_thread(_cached_lookup, list_of_texts)
+    if not missing:
+        return [cached[key] for key in keys]
     payload = {
-        "input": [f"search_query: {t}" for t in list_of_texts],
+        "input": [f"{QUERY_PREFIX}{list_of_texts[i]}" for i in missing],
         "model": MODEL_NAME,
         "input_type": "query"
     }
-    async with httpx.AsyncClient(timeout=600) as client:
-        response = await client.post(EMBEDDING_API_URL, json=payload)
-        if response.status_code != 200:
-            print(f"Failed to get response from {EMBEDDING_API_URL}:", response.text)
-            raise ForwardedHTTPException(
-                source="get_embeddings",
-                forwarded_by="embeddings.get_embeddings",
-                response=response,
-            )
-        response_body = response.json()
-        # with open(CACHE_PATH, "a") as f:
-        #     f.write(json.dumps({"payload": payload, "response": response_body}) + "\n")
-        if "embeddings" in response_body:
-            return response_body["embeddings"]
-        elif "data" in response_body and response_body["data"]:
-            return [item["embedding"] for item in response_body["data"]]
-        else:
-            raise KeyError(f"Embeddings not found in response: {response_body}")
\ No newline at end of file
+    client = get_embedding_client()
+    response = await client.post(EMBEDDING_API_URL, json=payload)
+    if response.status_code != 200:
+        print(f"Failed to get response from {EMBEDDING_API_URL}:", response.text)
+        raise ForwardedHTTPException(
+            source="get_embeddings",
+            forwarded_by="embeddings.get_embeddings",
+            response=response,
+        )
+    fetched = _parse_embeddings(response.json())
+    return await asyncio.to_thread(_merge_embeddings, keys, cached, missing, fetched)
+
+async def embed_batch_with_retry(batch, max_retries=EMBEDDING_MAX_RETRIES, label=""):
+    """One get_embeddings call, retried with exponential backoff on failure"""
+    for attempt in range(max_retries + 1):
+        try:
+            embs = await get_embeddings(batch)
+            if len(embs) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(embs)}")
+            return embs
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = 0.5 * (2 ** attempt)
+            print(f"Embedding batch {label} failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def embed_in_batches(list_of_texts, batch_size=EMBEDDING_BATCH_SIZE,
+                           concurrency=EMBEDDING_CONCURRENCY,
+                           max_retries=EMBEDDING_MAX_RETRIES,
+                           on_batch_done=None):
+    """
+    Embed many texts with the list API, running up to `concurrency` batches
+    at once. Results come back in input order. A failed batch is retried on
+    its own (with exponential backoff) without re-sending the others.
+    """
+    batches = [
+        list_of_texts[i:i + batch_size]
+        for i in range(0, len(list_of_texts), batch_size)
+    ]
+    results = [None] * len(batches)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_batch(index, batch):
+        async with semaphore:
+            embs = await embed_batch_with_retry(batch, max_retries, label=index)
+        results[index] = embs
+        if on_batch_done is not None:
+            on_batch_done(len(batch))
+
+    tasks = [asyncio.ensure_future(run_batch(i, b)) for i, b in enumerate(batches)]
+    try:
+        await asyncio.gather(*tasks)
+    except Exception:
+        # Don't leave sibling batches running after a batch gave up
+        for task in tasks:
+            task.cancel()
+        raise
+    return [emb for batch in results for emb in batch]
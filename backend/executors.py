@@ -0,0 +1,45 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SEARCH_WORKERS, INGEST_IO_WORKERS
+
+# Execution layer for blocking work started from async code.
+# Chroma calls block, so they never run on the event loop: vector searches
+# get their own bounded thread pool, and ingest writes (upserts, deletes,
+# manifest saves) a separate small one, so a long ingest can only ever
+# occupy its own threads and queries do not queue behind it. Tree-sitter
+# parsing runs in chunker's process pool, and the SQLite embedding cache
+# (used by both queries and ingest) in asyncio's default thread pool.
+_pools = {}
+
+_WORKERS = {
+    "search": SEARCH_WORKERS,
+    "ingest": INGEST_IO_WORKERS,
+}
+
+def _get_pool(name):
+    pool = _pools.get(name)
+    if pool is None:
+        pool = ThreadPoolExecutor(max_workers=max(1, _WORKERS[name]), thread_name_prefix=f"askhim-{name}")
+        _pools[name] = pool
+    return pool
+
+async def _run(name, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(name), functools.partial(func, *args, **kwargs))
+
+async def run_search(func, *args, **kwargs):
+    """Run a blocking vector store read on the search pool"""
+    return await _run("search", func, *args, **kwargs)
+
+async def run_ingest_io(func, *args, **kwargs):
+    """Run a blocking vector store write or manifest save on the ingest pool"""
+    return await _run("ingest", func, *args, **kwargs)
+
+def shutdown_executors():
+    """Wait for pending writes, then stop the pools (called from the app lifespan)"""
+    pools = list(_pools.values())
+    _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True)
@@ -0,0 +1,71 @@
+import os
+import subprocess
+
+# Helpers for indexing a git checkout by commit diff instead of a full scan.
+# Paths are reported relative to the workspace (`git diff --relative`), so a
+# workspace may also be a subdirectory of a larger repository.
+
+class GitError(Exception):
+    pass
+
+def _git(workspace_dir, *args):
+    try:
+        result = subprocess.run(
+            ["git", "-C", workspace_dir, *args],
+            capture_output=True,
+            check=True,
+        )
+    except FileNotFoundError:
+        raise GitError("git executable not found")
+    except subprocess.CalledProcessError as e:
+        raise GitError(e.stderr.decode(errors="replace").strip() or str(e))
+    return result.stdout.decode("utf-8", errors="surrogateescape")
+
+def is_git_workspace(workspace_dir):
+    try:
+        return _git(workspace_dir, "rev-parse", "--is-inside-work-tree").strip() == "true"
+    except GitError:
+        return False
+
+def head_commit(workspace_dir):
+    return _git(workspace_dir, "rev-parse", "HEAD").strip()
+
+def commit_exists(workspace_dir, sha):
+    """False if the commit is unknown, e.g. after a force-push and gc"""
+    try:
+        _git(workspace_dir, "cat-file", "-e", f"{sha}^{{commit}}")
+        return True
+    except GitError:
+        return False
+
+def changed_files(workspace_dir, old_sha, new_sha):
+    """
+    Files that differ between two commits, from `git diff --name-status`.
+    Returns (updated, deleted) as absolute paths: added, modified, copied,
+    type-changed and rename targets are updated; deleted files and rename
+    sources are deleted.
+    """
+    output = _git(
+        workspace_dir, "diff", "--name-status", "-z", "-M", "--relative",
+        f"{old_sha}..{new_sha}",
+    )
+    fields = output.split("\0")
+    updated, deleted = [], []
+    i = 0
+    while i < len(fields) and fields[i]:
+        status = fields[i][0]
+        if status in ("R", "C"):
+            old_path, new_path = fields[i + 1], fields[i + 2]
+            if status == "R":
+                deleted.append(old_path)
+            updated.append(new_path)
+            i += 3
+        else:
+            path = fields[i + 1]
+            (deleted if status == "D" else updated).append(path)
+            i += 2
+    root = os.path.abspath(workspace_dir)
+    return (
+        [os.path.join(root, p) for p in updated],
+        [os.path.join(root, p) for p in deleted],
+    )
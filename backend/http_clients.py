@@ -0,0 +1,71 @@
+import asyncio
+import httpx
+
+from config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP2_ENABLED,
+    EMBEDDING_TIMEOUT,
+    LLM_TIMEOUT,
+)
+
+# Long-lived, pooled HTTP clients for the embedding and LLM servers.
+# The API creates them in its lifespan and closes them on shutdown; every
+# route, background ingest and watcher shares them, so requests reuse warm
+# keep-alive connections instead of paying a TCP/TLS handshake each time.
+# Scripts that never start the app get a client lazily on first use.
+_clients = {}
+
+def _http2_available():
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("Warning: HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+        return False
+
+def _new_client(read_timeout):
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(read_timeout, connect=HTTP_CONNECT_TIMEOUT),
+        http2=_http2_available(),
+    )
+
+_TIMEOUTS = {
+    "embedding": EMBEDDING_TIMEOUT,
+    "llm": LLM_TIMEOUT,
+}
+
+def _get_client(name):
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(name)
+    # A pool is tied to the event loop it was opened on
+    if entry is None or entry[1] is not loop or entry[0].is_closed:
+        entry = (_new_client(_TIMEOUTS[name]), loop)
+        _clients[name] = entry
+    return entry[0]
+
+def get_embedding_client():
+    return _get_client("embedding")
+
+def get_llm_client():
+    return _get_client("llm")
+
+async def open_clients():
+    """Create the pools up front (called from the app lifespan)"""
+    for name in _TIMEOUTS:
+        _get_client(name)
+
+async def close_clients():
+    clients = list(_clients.values())
+    _clients.clear()
+    for client, _ in clients:
+        await client.aclose()
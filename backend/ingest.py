@@ -1,79 +1,178 @@
 import asyncio
-from embeddings import get_embedding
-from workspace import scan_workspace
-from milvusdb import insert_chunks
+from embeddings import embed_in_batches, get_cache_stats
+from milvusdb import insert_chunks, delete_file_chunks, collection_count
+from manifest import FileManifest, hash_file
+from lexical_index import get_lexical_index
 from config import WORKSPACE_DIR
 from tqdm import tqdm
-from chunker import chunk_python_by_functions_and_classes
+from chunker import chunk_source_file, get_chunk_pool
+from executors import run_ingest_io
+from query_cache import bump_index_version
+from pipeline import run_ingest_pipeline
+from watcher import watch_workspace
+from git_changes import GitError, is_git_workspace, head_commit, commit_exists, changed_files
 import pickle
 import os
 
-async def process_file(file_path, repo_name=None):
+async def embed_chunks(chunks):
+    """Embed chunk contents in concurrent batches, keeping chunk order"""
+    with tqdm(total=len(chunks), desc="Embedding chunks") as progress:
+        embeddings = await embed_in_batches(
+            [c["content"] for c in chunks],
+            on_batch_done=progress.update,
+        )
+    print("Embedding cache:", get_cache_stats())
+    return embeddings
+
+def _replace_file_chunks(file_path, repo_name, chunks, embeddings):
+    """Swap a file's chunks in the collection and the lexical index"""
+    lexical = get_lexical_index(repo_name)
+    delete_file_chunks([file_path], repo_name)
+    lexical.remove_files([file_path])
+    if not chunks:
+        return None
+    inserted = insert_chunks(chunks, embeddings, repo_name)
+    lexical.add_chunks(chunks)
+    return inserted
+
+def _record_file(file_path, repo_name, chunk_ids):
+    st = os.stat(file_path)
+    manifest = FileManifest(repo_name)
+    manifest.record(file_path, st.st_size, st.st_mtime_ns, hash_file(file_path), chunk_ids)
+    manifest.save()
+
+def _workspace_root(file_path, repo_name):
+    """
+    The directory a file's path filters are relative to: the workspace the
+    repository was last ingested from, else WORKSPACE_DIR, else the file's
+    own directory.
+    """
+    manifest = FileManifest(repo_name)
+    for root in (manifest.meta.get("workspace_dir"), WORKSPACE_DIR):
+        if root and os.path.commonpath([file_path, os.path.abspath(root)]) == os.path.abspath(root):
+            return os.path.abspath(root)
+    return os.path.dirname(file_path)
+
+async def process_file(file_path, repo_name=None, workspace_dir=None):
+    file_path = os.path.abspath(file_path)
     if repo_name is None:
         # Use parent directory name as repo name
-        repo_name = os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+        repo_name = os.path.basename(os.path.dirname(file_path))
+    if workspace_dir is None:
+        workspace_dir = await run_ingest_io(_workspace_root, file_path, repo_name)
     
-    if file_path.endswith('.py'):
-        chunks = chunk_python_by_functions_and_classes(file_path)
-    else:
-        chunks = []
+    # Parse in the chunker's worker processes, not on the event loop
+    loop = asyncio.get_running_loop()
+    chunks = await loop.run_in_executor(get_chunk_pool(), chunk_source_file, file_path)
+    # Workspace-relative path, which query path filters match against
+    relative = os.path.relpath(file_path, workspace_dir).replace(os.sep, "/")
+    for c in chunks:
+        c["path"] = relative
     print(f"Total chunks to embed: {len(chunks)}")
-    embeddings = []
-    for c in tqdm(chunks, desc="Embedding chunks"):
-        emb = await get_embedding(c["content"])
-        embeddings.append(emb)
+    embeddings = await embed_chunks(chunks)
     if len(chunks) != len(embeddings):
         print(f"ERROR: Number of chunks ({len(chunks)}) does not match number of embeddings ({len(embeddings)}).")
         return
-    inserted = insert_chunks(chunks, embeddings, repo_name)
+    # Replace whatever an earlier version of this file left in the index
+    inserted = await run_ingest_io(_replace_file_chunks, file_path, repo_name, chunks, embeddings)
+    bump_index_version(repo_name)
+    if not chunks:
+        print("No chunks found in file.")
+        return
+    await run_ingest_io(_record_file, file_path, repo_name, inserted["ids"])
     print(f"Inserted into ChromaDB (repository: {repo_name}).")
     print("Collection count after insert:", len(inserted["ids"]))
-    for i in range(len(inserted["ids"])):
+    for chunk_id, c in zip(inserted["ids"], chunks):
         print({
-            "id": inserted["ids"][i],
-            "file": inserted["metadatas"][i].get("file"),
-            "start_line": inserted["metadatas"][i].get("start_line"),
-            "type": inserted["metadatas"][i].get("type"),
-            "name": inserted["metadatas"][i].get("name"),
-            "content": inserted["documents"][i][:80] + "..."
+            "id": chunk_id,
+            "file": c["file"],
+            "start_line": c["start_line"],
+            "type": c.get("type"),
+            "name": c.get("name"),
+            "content": c["content"][:80] + "..."
         })
 
-async def process_workspace(workspace_dir):
-    # Use the directory name as the repo name
-    repo_name = os.path.basename(os.path.abspath(workspace_dir))
+async def ingest_git_changes(workspace_dir, repo_name, full=False):
+    """
+    Index a git checkout by commit: the first run (or full=True) scans the
+    whole tree, later runs only touch the files in
+    `git diff --name-status <last indexed>..HEAD`. The workspace is expected
+    to be checked out at HEAD.
+    """
+    if not await asyncio.to_thread(is_git_workspace, workspace_dir):
+        raise GitError(f"Not a git checkout: {workspace_dir}")
+    head = await asyncio.to_thread(head_commit, workspace_dir)
+    manifest = await run_ingest_io(FileManifest, repo_name)
+    last = manifest.meta.get("git_commit")
+    if (full or not last or not await asyncio.to_thread(commit_exists, workspace_dir, last)
+            or (manifest.has_chunks() and await run_ingest_io(collection_count, repo_name) == 0)):
+        print(f"Indexing commit {head[:12]} with a full scan")
+        return await run_ingest_pipeline(workspace_dir, repo_name, full=full, commit=head)
+    if last == head:
+        print(f"Index is already at commit {head[:12]}")
+        updated, deleted = [], []
+    else:
+        updated, deleted = await asyncio.to_thread(changed_files, workspace_dir, last, head)
+        print(f"Commits {last[:12]}..{head[:12]}: {len(updated)} updated, {len(deleted)} deleted files")
+    return await run_ingest_pipeline(workspace_dir, repo_name, paths=updated + deleted, commit=head)
+
+async def process_workspace(workspace_dir, repo_name=None, full=False, git=False):
+    """
+    Bring a repository's collection in line with the workspace on disk.
+    Only new or edited files are chunked and embedded; chunks of edited and
+    removed files are deleted. Pass full=True to re-ingest every file, or
+    git=True to find changed files from the commits since the last ingest.
+    """
+    workspace_dir = os.path.abspath(workspace_dir)
+    if repo_name is None:
+        # Use the directory name as the repo name
+        repo_name = os.path.basename(workspace_dir)
     print(f"Processing workspace as repository: {repo_name}")
-    
-    all_chunks = []
-    for file in scan_workspace(workspace_dir):
-        if file.endswith('.py'):
-            chunks = chunk_python_by_functions_and_classes(file)
-            all_chunks.extend(chunks)
-    print(f"Total chunks to embed: {len(all_chunks)}")
-    embeddings = []
-    for c in tqdm(all_chunks, desc="Embedding chunks"):
-        emb = await get_embedding(c["content"])
-        embeddings.append(emb)
-    
-    if len(all_chunks) != len(embeddings):
-        print(f"ERROR: Number of chunks ({len(all_chunks)}) does not match number of embeddings ({len(embeddings)}).")
-        print("Aborting insertion.")
-        return
-    inserted = insert_chunks(all_chunks, embeddings, repo_name)
-    print(f"Inserted into ChromaDB (repository: {repo_name}).")
-    print("Collection count after insert:", len(inserted["ids"]))
 
-if __name__ == "__main__":
-    import sys
-    if len(sys.argv) == 2:
-        arg = sys.argv[1]
-        if arg.endswith('.py'):
-            asyncio.run(process_file(arg))
-            exit(0)
-        else:
-            workspace_dir = arg
-    elif WORKSPACE_DIR:
-        workspace_dir = WORKSPACE_DIR
+    if git:
+        stats = await ingest_git_changes(workspace_dir, repo_name, full=full)
     else:
-        print("Usage: python main.py <workspace_dir|file.py> or set WORKSPACE_DIR in your environment/config.py")
+        stats = await run_ingest_pipeline(workspace_dir, repo_name, full=full)
+    print(
+        f"Files: {stats['files_changed']} new or changed, {stats['files_removed']} removed, "
+        f"{stats['files_unchanged']} unchanged, {stats['files_failed']} failed"
+    )
+    print(f"Inserted {stats['chunks_inserted']} chunks in {stats['elapsed']:.1f}s "
+          f"({stats['chunks_per_sec']:.1f} chunks/s) into ChromaDB (repository: {repo_name}).")
+    print(f"ChromaDB write throughput: {stats['insert_rows_per_sec']:.0f} rows/s")
+    print(f"Stage time: chunk {stats['chunk_seconds']:.1f}s, "
+          f"embed {stats['embed_seconds']:.1f}s, insert {stats['insert_seconds']:.1f}s")
+    print("Collection count after ingest:", await run_ingest_io(collection_count, repo_name))
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingest a workspace or a single file into ChromaDB")
+    parser.add_argument("path", nargs="?", default=WORKSPACE_DIR,
+                        help="Workspace directory or .py file (defaults to WORKSPACE_DIR)")
+    parser.add_argument("-r", "--repository", help="Repository name (defaults to the directory name)")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-ingest every file instead of only new or changed ones")
+    parser.add_argument("--git", action="store_true",
+                        help="Find changed files with git diff against the last indexed commit")
+    parser.add_argument("--watch", action="store_true",
+                        help="After ingesting, keep watching the workspace and re-ingest files as they change")
+    args = parser.parse_args()
+
+    if not args.path:
+        parser.print_usage()
+        print("Pass <workspace_dir|file.py> or set WORKSPACE_DIR in your environment/config.py")
         exit(1)
-    asyncio.run(process_workspace(workspace_dir))
+    if args.path.endswith('.py'):
+        asyncio.run(process_file(args.path, args.repository))
+    elif args.watch:
+        async def ingest_and_watch():
+            await process_workspace(args.path, args.repository, full=args.full, git=args.git)
+            await watch_workspace(args.path, args.repository, catch_up=False)
+        try:
+            asyncio.run(ingest_and_watch())
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+    else:
+        asyncio.run(process_workspace(args.path, args.repository, full=args.full, git=args.git))
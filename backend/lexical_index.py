@@ -0,0 +1,194 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from milvusdb import CHROMA_DATA_DIR, get_collection_name, chunk_id
+
+# Per-repository BM25 index over chunk names, file paths and code tokens.
+# Identifiers are indexed whole and split on snake_case/camelCase, so both
+# "chunk_python_by_functions_and_classes" and "python chunks" find the same
+# function. It is kept in a SQLite database next to the Chroma data and is
+# updated by the same ingest writes as the vector collection.
+LEXICAL_DIR = os.path.join(CHROMA_DATA_DIR, "lexical")
+
+# Names and paths say more about a chunk than any one token in its body
+NAME_WEIGHT = 5
+PATH_WEIGHT = 2
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms in over half the chunks are skipped once the index has this many chunks
+COMMON_TERM_MIN_CHUNKS = 1000
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_WORD_PARTS = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "code", "do", "does",
+    "for", "from", "how", "i", "if", "in", "is", "it", "me", "of", "on", "or",
+    "show", "that", "the", "this", "to", "what", "when", "where", "which", "who",
+    "why", "with", "work", "works",
+}
+
+def split_identifier(identifier):
+    """`parse_HTTPResponse2` -> ["parse", "http", "response", "2"]"""
+    return [part.lower() for part in _WORD_PARTS.findall(identifier)]
+
+def tokenize(text):
+    """Lower-cased identifiers plus their snake/camel case parts"""
+    tokens = []
+    for identifier in _IDENTIFIER.findall(text):
+        whole = identifier.lower()
+        if len(whole) > 1:
+            tokens.append(whole)
+        parts = split_identifier(identifier)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if len(p) > 1)
+    return tokens
+
+def looks_like_symbol(word):
+    """snake_case, camelCase, dotted or numbered words are code, not English"""
+    return "_" in word or any(c.isdigit() for c in word) or any(c.isupper() for c in word[1:])
+
+def query_symbols(question):
+    """Identifiers in a question that are probably names of definitions"""
+    symbols = set()
+    for match in re.finditer(r"`([^`]+)`|([A-Za-z_][A-Za-z0-9_.]*)(\()?", question):
+        quoted, word, call = match.groups()
+        dotted = word is not None and "." in word.strip(".")
+        for name in _IDENTIFIER.findall(quoted or word):
+            if quoted or call or dotted or looks_like_symbol(name):
+                symbols.add(name)
+    return symbols
+
+class LexicalIndex:
+    def __init__(self, repo_name=None):
+        self.path = os.path.join(LEXICAL_DIR, f"{get_collection_name(repo_name)}.sqlite3")
+        self._local = threading.local()
+        os.makedirs(LEXICAL_DIR, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id TEXT PRIMARY KEY,"
+            " file TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " length INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS chunks_file ON chunks (file);"
+            "CREATE INDEX IF NOT EXISTS chunks_name ON chunks (name);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL,"
+            " chunk_id TEXT NOT NULL,"
+            " tf INTEGER NOT NULL,"
+            " PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);"
+        )
+        conn.commit()
+
+    def _connection(self):
+        """One connection per thread, as in EmbeddingCache"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add_chunks(self, chunks):
+        """Index (or re-index) chunks, keyed by the same ids as the collection"""
+        chunk_rows, posting_rows = [], []
+        for c in chunks:
+            terms = Counter(tokenize(c["content"]))
+            for term in tokenize(c.get("name") or ""):
+                terms[term] += NAME_WEIGHT
+            for term in tokenize(c["file"]):
+                terms[term] += PATH_WEIGHT
+            cid = chunk_id(c)
+            chunk_rows.append((cid, c["file"], c.get("name") or "", sum(terms.values())))
+            posting_rows.extend((term, cid, tf) for term, tf in terms.items())
+        conn = self._connection()
+        with conn:
+            self._delete_ids(conn, [row[0] for row in chunk_rows])
+            conn.executemany("INSERT OR REPLACE INTO chunks (id, file, name, length) VALUES (?, ?, ?, ?)", chunk_rows)
+            conn.executemany("INSERT OR REPLACE INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", posting_rows)
+
+    def remove_files(self, file_paths):
+        file_paths = list(file_paths)
+        if not file_paths:
+            return
+        conn = self._connection()
+        with conn:
+            for i in range(0, len(file_paths), 500):
+                part = file_paths[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                ids = [row[0] for row in conn.execute(
+                    f"SELECT id FROM chunks WHERE file IN ({placeholders})", part
+                )]
+                self._delete_ids(conn, ids)
+
+    @staticmethod
+    def _delete_ids(conn, ids):
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", part)
+            conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", part)
+
+    def find_symbols(self, names):
+        """Ids of chunks defining any of these names (exact, case-sensitive)"""
+        names = list(names)
+        if not names:
+            return []
+        placeholders = ",".join("?" * len(names))
+        rows = self._connection().execute(
+            f"SELECT id FROM chunks WHERE name IN ({placeholders}) ORDER BY length", names
+        )
+        return [row[0] for row in rows]
+
+    def search(self, query, top_k=10):
+        """BM25 over the query's tokens; returns [(chunk id, score)], best first"""
+        terms = [t for t in dict.fromkeys(tokenize(query)) if t not in STOP_WORDS]
+        if not terms:
+            return []
+        conn = self._connection()
+        n, avg_length = conn.execute("SELECT COUNT(*), AVG(length) FROM chunks").fetchone()
+        if not n:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        df = dict(conn.execute(
+            f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term",
+            terms,
+        ).fetchall())
+        terms = [t for t in terms if t in df]
+        if not terms:
+            return []
+        if n >= COMMON_TERM_MIN_CHUNKS:
+            # Terms in most chunks (e.g. `self`) barely move the ranking but cost the most.
+            # Small indexes are cheap to score in full, and there any term may be common.
+            terms = [t for t in terms if df[t] <= n // 2] or terms
+        idf = {t: math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5)) for t in terms}
+        placeholders = ",".join("?" * len(terms))
+        scores = Counter()
+        for term, cid, tf, length in conn.execute(
+            f"SELECT p.term, p.chunk_id, p.tf, c.length FROM postings p"
+            f" JOIN chunks c ON c.id = p.chunk_id WHERE p.term IN ({placeholders})",
+            terms,
+        ):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[cid] += idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores.most_common(top_k)
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_lexical_index(repo_name=None):
+    with _indexes_lock:
+        index = _indexes.get(repo_name)
+        if index is None:
+            index = LexicalIndex(repo_name)
+            _indexes[repo_name] = index
+        return index
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+
+from milvusdb import CHROMA_DATA_DIR, get_collection_name
+
+# Per-repository record of which files are in the index and what they looked
+# like when they were ingested (size, mtime and content hash). Re-ingests use
+# it to skip unchanged files without reading them, and to find files that were
+# edited or removed since the last run.
+MANIFEST_DIR = os.path.join(CHROMA_DATA_DIR, "manifests")
+MANIFEST_VERSION = 1
+
+def hash_file(file_path):
+    """sha256 of a file's contents, read in 1 MiB blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def manifest_path(repo_name=None):
+    return os.path.join(MANIFEST_DIR, f"{get_collection_name(repo_name)}.json")
+
+class FileManifest:
+    def __init__(self, repo_name=None):
+        self.collection_name = get_collection_name(repo_name)
+        self.path = manifest_path(repo_name)
+        self.files = {}
+        self.meta = {}
+        self.dirty = False        # changed since it was loaded or saved
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Warning: ignoring unreadable manifest {self.path}: {e}")
+            return
+        if data.get("version") != MANIFEST_VERSION:
+            print(f"Warning: manifest {self.path} has an old format, re-ingesting everything")
+            return
+        self.files = data.get("files", {})
+        self.meta = data.get("meta", {})
+
+    def save(self):
+        """Write atomically so an interrupted save never corrupts the manifest"""
+        os.makedirs(MANIFEST_DIR, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "meta": self.meta,
+                "files": self.files,
+            }, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def check(self, path, force=False):
+        """
+        Return None if the file on disk matches the manifest, otherwise
+        (size, mtime_ns, sha256) for the new contents. With force=True every
+        file counts as changed. Files whose size and mtime match are trusted
+        without being read; files that were only touched get their mtime
+        refreshed. Raises OSError if the file cannot be read.
+        """
+        st = os.stat(path)
+        entry = None if force else self.files.get(path)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime_ns:
+            return None
+        digest = hash_file(path)
+        if entry and entry["sha256"] == digest:
+            entry["size"] = st.st_size
+            entry["mtime"] = st.st_mtime_ns
+            return None
+        return st.st_size, st.st_mtime_ns, digest
+
+    def removed_since(self, seen_paths):
+        """Manifest paths that are not in `seen_paths`"""
+        return [path for path in self.files if path not in seen_paths]
+
+    def diff(self, file_paths, force=False):
+        """
+        Compare files on disk with the manifest.
+        Returns (changed, removed, unchanged_count) where `changed` is a list of
+        (path, size, mtime_ns, sha256) for new or edited files and `removed`
+        lists manifest paths that are no longer present.
+        """
+        changed = []
+        unchanged = 0
+        seen = set()
+        for path in file_paths:
+            seen.add(path)
+            try:
+                info = self.check(path, force)
+            except OSError:
+                continue
+            if info is None:
+                unchanged += 1
+            else:
+                changed.append((path, *info))
+        return changed, self.removed_since(seen), unchanged
+
+    def record(self, path, size, mtime_ns, sha256, chunk_ids):
+        self.files[path] = {
+            "size": size,
+            "mtime": mtime_ns,
+            "sha256": sha256,
+            "chunk_ids": chunk_ids,
+        }
+        self.dirty = True
+
+    def has_chunks(self):
+        """Whether any recorded file has chunks in the index"""
+        return any(entry.get("chunk_ids") for entry in self.files.values())
+
+    def forget(self, path):
+        if self.files.pop(path, None) is not None:
+            self.dirty = True
@@ -0,0 +1,149 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Process-wide latency histograms and counters, rendered in the Prometheus
+# text format by GET /metrics.
+# Query stages (question embedding, lexical and vector search, prompt build,
+# LLM time to first token and total) and ingest stages (chunk, embed, insert)
+# all land in one histogram labelled by stage, so a slow answer can be traced
+# to Chroma, the embedding server or the LLM. Metrics are updated from the
+# event loop and from worker threads, hence the lock.
+
+# Upper bounds in seconds, from a cache hit to a long generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+_lock = threading.Lock()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            samples = list(self._samples())
+        for suffix, pairs, value in samples:
+            lines.append(f"{self.name}{suffix}{_format_labels(pairs)} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        if not self.label_names:
+            # Report 0 rather than nothing until the first increment
+            self.values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def _samples(self):
+        for key, value in sorted(self.values.items()):
+            yield "", list(zip(self.label_names, key)), value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            series["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def _samples(self):
+        for key, series in sorted(self.values.items()):
+            pairs = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["buckets"]):
+                cumulative += count
+                yield "_bucket", pairs + [("le", _format_value(float(bound)))], cumulative
+            yield "_sum", pairs, series["sum"]
+            yield "_count", pairs, series["count"]
+
+def render():
+    """Every registered metric in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+STAGE_SECONDS = Histogram(
+    "askhim_stage_seconds", "Seconds spent in each query or ingest stage.", ["stage"]
+)
+QUERY_SECONDS = Histogram(
+    "askhim_query_seconds", "End-to-end query latency by endpoint.", ["endpoint"]
+)
+QUERIES = Counter(
+    "askhim_queries_total", "Queries by endpoint and outcome (ok, cached, error, timeout, disconnected).",
+    ["endpoint", "outcome"]
+)
+INGEST_FILES = Counter(
+    "askhim_ingest_files_total", "Files seen by ingestion, by outcome (changed, unchanged, removed, failed).",
+    ["outcome"]
+)
+INGEST_CHUNKS = Counter("askhim_ingest_chunks_total", "Chunks written to the vector store by ingestion.")
+
+def record(timings, stage, seconds):
+    """Add seconds to timings[stage] and to the stage histogram"""
+    timings[stage] = timings.get(stage, 0.0) + seconds
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+@contextmanager
+def timed(timings, stage):
+    """record() the time spent in the with block"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(timings, stage, time.perf_counter() - start)
+
+def record_query(endpoint, outcome, seconds=None):
+    QUERIES.inc(endpoint=endpoint, outcome=outcome)
+    if seconds is not None:
+        QUERY_SECONDS.observe(seconds, endpoint=endpoint)
+
+def server_timing(timings):
+    """A Server-Timing header value from stage timings in seconds"""
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.1f}"
+        for stage, seconds in timings.items() if seconds is not None
+    )
@@ -1,19 +1,22 @@
-from config import EMBEDDING_DIM
-import chromadb
+from config import EMBEDDING_DIM, CHROMA_INSERT_BATCH_SIZE, CHROMA_DATA_DIR as CONFIGURED_DATA_DIR
+from vectorstores import create_vector_store
+from search_filters import GLOB_OVERFETCH, path_metadata, matches, matches_glob
 import numpy as np
 import os
 import hashlib
+import time
 
-# Always use project-root-relative chroma_data directory
+# Project-root-relative chroma_data directory, unless CHROMA_DATA_DIR says otherwise
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-CHROMA_DATA_DIR = os.path.join(BASE_DIR, "chroma_data")
+CHROMA_DATA_DIR = os.path.abspath(CONFIGURED_DATA_DIR) if CONFIGURED_DATA_DIR else os.path.join(BASE_DIR, "chroma_data")
 
 print("ChromaDB persist_directory:", CHROMA_DATA_DIR)
 os.makedirs(CHROMA_DATA_DIR, exist_ok=True)
 if not os.access(CHROMA_DATA_DIR, os.W_OK):
     raise PermissionError(f"Cannot write to ChromaDB persist_directory: {CHROMA_DATA_DIR}")
 
-client = chromadb.PersistentClient(path=CHROMA_DATA_DIR)
+# Every read and write below goes through the configured VectorStore (VECTOR_STORE)
+store = create_vector_store(CHROMA_DATA_DIR)
 DEFAULT_COLLECTION_NAME = "code_chunks"
 
 def get_collection_name(repo_name=None):
@@ -26,58 +29,160 @@ def get_collection_name(repo_name=None):
     hashed = hashlib.md5(repo_name.encode()).hexdigest()[:10]
     return f"repo_{hashed}_{os.path.basename(repo_name)}"
 
-def get_collection(repo_name=None):
-    """Get or create a collection for the specified repository"""
-    collection_name = get_collection_name(repo_name)
-    try:
-        collection = client.get_collection(name=collection_name)
-        # print(f"Using existing collection: {collection_name}")
-    except Exception:
-        collection = client.create_collection(name=collection_name)
-        print(f"Created new collection: {collection_name}")
-    return collection
-
-def insert_chunks(chunks, embeddings, repo_name=None):
-    collection = get_collection(repo_name)
-    ids = [f"{c['file']}:{c['start_line']}" for c in chunks]
-    metadatas = [
-        {
-            "file": c["file"],
-            "start_line": c["start_line"],
-            "type": c.get("type") or "",
-            "name": c.get("name") or ""
-        }
-        for c in chunks
-    ]
-    documents = [c["content"] for c in chunks]
-    collection.add(
-        ids=ids,
-        embeddings=embeddings,
-        metadatas=metadatas,
-        documents=documents
-    )
+# Collections whose repository name this process has already recorded
+_named_collections = set()
+
+def _record_repository_name(collection, repo_name):
+    """Keep the name a repository was ingested under with its collection"""
+    if repo_name and collection not in _named_collections:
+        store.set_collection_metadata(collection, {"repository": repo_name})
+        _named_collections.add(collection)
+
+def list_repository_names():
+    """Names ingested repositories were stored under (usable with get_collection_name)"""
+    repositories = []
+    for collection_name in store.list_collections():
+        if not collection_name.startswith("repo_"):
+            continue
+        repo_name = (store.collection_metadata(collection_name) or {}).get("repository")
+        if repo_name is None:
+            # Ingested before names were recorded: the basename suffix is
+            # the name only if it hashes back to this collection
+            suffix = collection_name.split("_", 2)[-1]
+            if get_collection_name(suffix) != collection_name:
+                print(f"Leaving out {collection_name}: re-ingest it to record its repository name")
+                continue
+            repo_name = suffix
+        repositories.append(repo_name)
+    return repositories
+
+def chunk_id(chunk):
+    """Stable id of a chunk within its collection"""
+    # Later parts of a split class skeleton can start on a method's first
+    # line, so they get a suffix to keep clear of that method's id
+    if (chunk.get("part") or 0) > 1:
+        return f"{chunk['file']}:{chunk['start_line']}#{chunk['part']}"
+    return f"{chunk['file']}:{chunk['start_line']}"
+
+def chunk_metadata(chunk):
+    return {
+        "file": chunk["file"],
+        "start_line": chunk["start_line"],
+        "end_line": chunk.get("end_line") or chunk["start_line"],
+        "type": chunk.get("type") or "",
+        "name": chunk.get("name") or "",
+        "parent": chunk.get("parent") or "",
+        "part": chunk.get("part") or 0,
+        "commit": chunk.get("commit") or "",
+        # path, language and dir1..dirN, for filtered queries
+        **path_metadata(chunk.get("path") or chunk["file"])
+    }
+
+def max_insert_batch_size():
+    """Largest batch the store accepts, capped by CHROMA_INSERT_BATCH_SIZE"""
+    store_max = store.max_batch_size or CHROMA_INSERT_BATCH_SIZE
+    return max(1, min(store_max, CHROMA_INSERT_BATCH_SIZE))
+
+def insert_chunks(chunks, embeddings, repo_name=None, batch_size=None):
+    """
+    Insert or replace chunks; upsert keeps re-ingests idempotent.
+    Writes go out in batches no larger than the store's maximum, and the
+    per-batch id/metadata/document lists are built one batch at a time.
+    """
+    collection = get_collection_name(repo_name)
+    _record_repository_name(collection, repo_name)
+    batch_size = min(batch_size or CHROMA_INSERT_BATCH_SIZE, max_insert_batch_size())
+    ids = []
+    start_time = time.perf_counter()
+    batches = 0
+    for i in range(0, len(chunks), batch_size):
+        batch = chunks[i:i + batch_size]
+        batch_ids = [chunk_id(c) for c in batch]
+        store.upsert(
+            collection,
+            batch_ids,
+            embeddings[i:i + batch_size],
+            [chunk_metadata(c) for c in batch],
+            [c["content"] for c in batch]
+        )
+        ids.extend(batch_ids)
+        batches += 1
+    seconds = time.perf_counter() - start_time
+    rows_per_sec = len(ids) / seconds if seconds else 0.0
+    if batches > 1:
+        print(f"Upserted {len(ids)} chunks in {batches} batches ({rows_per_sec:.0f} rows/s)")
     return {
         "ids": ids,
-        "metadatas": metadatas,
-        "documents": documents
+        "count": len(ids),
+        "seconds": seconds,
+        "rows_per_sec": rows_per_sec
     }
 
-def semantic_search(query_embedding, top_k=5, repo_name=None):
-    collection = get_collection(repo_name)
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
-        include=["metadatas", "documents", "distances"]
+def delete_file_chunks(file_paths, repo_name=None, batch_size=100):
+    """Delete every chunk that came from any of the given files"""
+    if not file_paths:
+        return
+    collection = get_collection_name(repo_name)
+    file_paths = list(file_paths)
+    for i in range(0, len(file_paths), batch_size):
+        store.delete_files(collection, file_paths[i:i + batch_size])
+
+def collection_count(repo_name=None):
+    return store.count(get_collection_name(repo_name))
+
+def collection_stats(repo_name=None):
+    return store.stats(get_collection_name(repo_name))
+
+def _hit(meta, document, distance=None):
+    return {
+        "file": meta.get("file"),
+        "start_line": meta.get("start_line"),
+        "content": document,
+        "end_line": meta.get("end_line"),
+        "type": meta.get("type"),
+        "name": meta.get("name"),
+        "parent": meta.get("parent"),
+        "distance": distance
+    }
+
+def semantic_search(query_embedding, top_k=5, repo_name=None, search_filter=None):
+    return semantic_search_many([query_embedding], top_k, repo_name, search_filter)[0]
+
+def semantic_search_many(query_embeddings, top_k=5, repo_name=None, search_filter=None):
+    """
+    One store query for several embeddings; a list of hits per embedding.
+    A search_filter (search_filters.make_filter) is applied by the store;
+    path globs it cannot express are checked on extra candidates afterwards.
+    """
+    where = where_document = None
+    fetch = top_k
+    if search_filter:
+        where, where_document = search_filter["where"], search_filter["where_document"]
+        if search_filter["globs"]:
+            fetch = top_k * GLOB_OVERFETCH
+    results = store.search(
+        get_collection_name(repo_name), query_embeddings, fetch,
+        where=where, where_document=where_document
     )
-    hits = []
-    for i in range(len(results["ids"][0])):
-        meta = results["metadatas"][0][i]
-        hits.append({
-            "file": meta.get("file"),
-            "start_line": meta.get("start_line"),
-            "content": results["documents"][0][i],
-            "type": meta.get("type"),
-            "name": meta.get("name"),
-            "distance": results["distances"][0][i]
-        })
-    return hits
+    return [
+        [
+            _hit(meta, document, distance)
+            for _, meta, document, distance in hits
+            if matches_glob(meta, search_filter)
+        ][:top_k]
+        for hits in results
+    ]
+
+def get_chunks(ids, repo_name=None, search_filter=None):
+    """
+    Chunks by id, as search hits (without a distance), in the order asked for.
+    With a search_filter, only the chunks that pass it.
+    """
+    if not ids:
+        return []
+    found = {
+        cid: _hit(meta, document)
+        for cid, meta, document in store.get(get_collection_name(repo_name), ids)
+        if matches(meta, document, search_filter)
+    }
+    return [found[cid] for cid in ids if cid in found]
@@ -1,10 +1,19 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional
+from typing import Optional, List
 
-class QueryRequest(BaseModel):
+class QueryFilters(BaseModel):
+    """Optional limits on which chunks a query may retrieve"""
+    path: Optional[str] = None  # Directory prefix, file path or glob, relative to the workspace
+    chunk_type: Optional[str] = None  # "function", "class" or a raw chunk type
+    symbol: Optional[str] = None  # Definition name, optionally qualified ("Class.method")
+    language: Optional[str] = None  # "python", "typescript", ... or a file extension
+    contains: Optional[str] = None  # Text the chunk must contain
+
+class QueryRequest(QueryFilters):
     """Request model for querying the RAG system"""
     question: str
     repository: Optional[str] = None
+    repositories: Optional[List[str]] = None  # Search several repositories at once; ["*"] for all
     template_name: str = "code_qa_template"
     include_context: bool = False  # Define as bool type
 
@@ -22,12 +31,25 @@ class QueryRequest(BaseModel):
             return v > 0
         return bool(v)
 
+class BatchQueryRequest(QueryFilters):
+    """Request model for answering many questions about one repository"""
+    questions: List[str]
+    repository: Optional[str] = None
+    template_name: str = "code_qa_template"
+
 class IngestRequest(BaseModel):
     """Request model for ingesting a workspace"""
     workspace_path: str
     repository_name: Optional[str] = None
+    full_reindex: bool = False  # Re-ingest every file instead of only changed ones
+    use_git: bool = False  # Find changed files from commits since the last ingest
 
 class IngestFileRequest(BaseModel):
     """Request model for ingesting a single file"""
     file_path: str
     repository_name: Optional[str] = None
+
+class WatchRequest(BaseModel):
+    """Request model for watching a workspace for changes"""
+    workspace_path: str
+    repository_name: Optional[str] = None
@@ -5,7 +5,11 @@ class QueryResponse(BaseModel):
     """Response model for query results"""
     answer: str
     repository: Optional[str] = None
+    repositories: Optional[List[str]] = None
     execution_time: float
+    context_tokens: Optional[int] = None  # Tokens of retrieved code in the prompt
+    cached: bool = False
+    timings: Optional[Dict[str, float]] = None  # Seconds per stage, plus "total"
 
 class IngestStatus(BaseModel):
     """Response model for ingestion status"""
@@ -14,6 +18,21 @@ class IngestStatus(BaseModel):
     message: str
     timestamp: float
 
+class WatchStatus(BaseModel):
+    """Response model for a workspace watcher"""
+    status: str  # "watching", "stopped", "error"
+    repository: str
+    workspace_path: str
+    started_at: float
+    updates: int
+    files_updated: int
+    last_update: Optional[float] = None
+    error: Optional[str] = None
+
+class WatchListResponse(BaseModel):
+    """Response model for watcher listing"""
+    watches: List[WatchStatus]
+
 class TemplateInfo(BaseModel):
     """Response model for template information"""
     name: str
@@ -0,0 +1,347 @@
+import asyncio
+import os
+import threading
+import time
+from tqdm import tqdm
+
+from chunker import chunk_files_parallel, is_chunkable
+from config import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CONCURRENCY,
+    PIPELINE_QUEUE_SIZE,
+    MANIFEST_SAVE_INTERVAL,
+    SCAN_WORKERS,
+)
+from embeddings import embed_batch_with_retry, get_cache_stats
+from executors import run_ingest_io
+from query_cache import bump_index_version
+from manifest import FileManifest
+from milvusdb import insert_chunks, delete_file_chunks, collection_count, chunk_id
+from lexical_index import get_lexical_index
+from metrics import STAGE_SECONDS, INGEST_FILES, INGEST_CHUNKS
+from workspace import scan_workspace, PathFilter
+
+# Streaming ingest pipeline: scan -> parse -> embed -> insert.
+# Each stage runs concurrently and hands work to the next one through a
+# bounded queue, so memory stays flat however large the repository is, and
+# a slow stage (usually the embedding server) throttles the ones before it.
+# Inserted batches are committed straight away; a file is recorded in the
+# manifest once all of its chunks are stored, and the manifest is saved
+# every MANIFEST_SAVE_INTERVAL seconds, so an interrupted ingest resumes
+# from there on the next run.
+
+_DONE = object()
+
+class IngestPipeline:
+    def __init__(self, workspace_dir, repo_name, full=False, paths=None, commit=None):
+        self.workspace_dir = workspace_dir
+        self.repo_name = repo_name
+        self.full = full
+        # Explicit file list (e.g. from the watcher or a git diff) instead of a full scan
+        self.paths = paths
+        # Git commit the workspace is at; stamped on chunks and the manifest
+        self.commit = commit
+        self.manifest = None
+        self.lexical = None
+        self.seen = set()
+        self.missing = []         # explicit paths that no longer exist or are now excluded
+        self.file_info = {}       # path -> (size, mtime_ns, sha256) of files in flight
+        self.remaining = {}       # path -> chunks not yet inserted
+        self.chunk_ids = {}       # path -> ids inserted so far
+        self.started = set()      # files whose old chunks were already deleted
+        self.stats = {
+            "files_changed": 0,
+            "files_unchanged": 0,
+            "files_removed": 0,
+            "files_failed": 0,
+            "chunks_inserted": 0,
+            # Summed per file / batch; stages overlap, so these can exceed "elapsed"
+            "chunk_seconds": 0.0,
+            "embed_seconds": 0.0,
+            "insert_seconds": 0.0,
+        }
+        self._stop = threading.Event()
+        self._last_save = time.monotonic()
+        self._progress = None
+
+    async def run(self):
+        start_time = time.monotonic()
+        self.manifest = await run_ingest_io(FileManifest, self.repo_name)
+        self.lexical = await run_ingest_io(get_lexical_index, self.repo_name)
+        # Only a manifest that recorded chunks can disagree with an empty index;
+        # a workspace without any chunkable code would re-ingest forever
+        has_chunks = self.manifest.has_chunks()
+        if has_chunks and await run_ingest_io(collection_count, self.repo_name) == 0:
+            print("Collection is empty but a manifest exists; re-ingesting everything.")
+            self.full = True
+        elif has_chunks and await run_ingest_io(self.lexical.count) == 0:
+            print("Lexical index is missing; re-ingesting everything.")
+            self.full = True
+
+        file_queue = asyncio.Queue()
+        file_slots = threading.Semaphore(PIPELINE_QUEUE_SIZE)
+        chunk_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        insert_queue = asyncio.Queue(maxsize=EMBEDDING_CONCURRENCY * 2)
+
+        self._progress = tqdm(desc="Inserted chunks", unit="chunk")
+        tasks = [
+            asyncio.ensure_future(self._scan(file_queue, file_slots)),
+            asyncio.ensure_future(self._parse(file_queue, file_slots, chunk_queue)),
+            asyncio.ensure_future(self._embed(chunk_queue, insert_queue)),
+            asyncio.ensure_future(self._insert(insert_queue)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+            if self.paths is None:
+                removed = self.manifest.removed_since(self.seen)
+            else:
+                removed = self.missing
+            if removed:
+                await run_ingest_io(self._remove_files, removed)
+                bump_index_version(self.repo_name)
+                for path in removed:
+                    self.manifest.forget(path)
+                self.stats["files_removed"] = len(removed)
+            if self.manifest.meta.get("workspace_dir") != self.workspace_dir:
+                # Lets single-file ingests store the same relative paths
+                self.manifest.meta["workspace_dir"] = self.workspace_dir
+                self.manifest.dirty = True
+            if self.commit and self.stats["files_failed"]:
+                # Keep the old commit so the next git diff brings the failed files back
+                print(f"{self.stats['files_failed']} files failed; not advancing the indexed commit")
+            elif self.commit and self.manifest.meta.get("git_commit") != self.commit:
+                # Only advance once everything up to this commit is stored
+                self.manifest.meta["git_commit"] = self.commit
+                self.manifest.dirty = True
+        except BaseException:
+            self._stop.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self._progress.close()
+            # Checkpoint whatever was fully committed, even on failure;
+            # shielded so a cancelled run still finishes the write. A run that
+            # changed nothing leaves the file (and cached answers) alone.
+            if self.manifest.dirty:
+                await asyncio.shield(run_ingest_io(self.manifest.save))
+
+        for outcome in ("changed", "unchanged", "removed", "failed"):
+            INGEST_FILES.inc(self.stats[f"files_{outcome}"], outcome=outcome)
+        elapsed = time.monotonic() - start_time
+        self.stats["elapsed"] = elapsed
+        self.stats["chunks_per_sec"] = self.stats["chunks_inserted"] / elapsed if elapsed else 0.0
+        insert_seconds = self.stats["insert_seconds"]
+        self.stats["insert_rows_per_sec"] = self.stats["chunks_inserted"] / insert_seconds if insert_seconds else 0.0
+        return self.stats
+
+    # Stage 1: walk the workspace (or the given paths) in a thread and queue new or changed files
+    async def _scan(self, file_queue, file_slots):
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.to_thread(self._scan_thread, loop, file_queue, file_slots)
+        finally:
+            self._stop.set()
+
+    def _scan_thread(self, loop, file_queue, file_slots):
+        try:
+            path_filter = None
+            if self.paths is None:
+                source = scan_workspace(self.workspace_dir, workers=SCAN_WORKERS)
+            else:
+                # Hold explicit paths to the scan's rules (ignore files, pruned dirs)
+                source = self.paths
+                path_filter = PathFilter(self.workspace_dir)
+            for path in source:
+                if self._stop.is_set():
+                    return
+                if not is_chunkable(path):
+                    continue
+                if path_filter is not None and path_filter.excludes(path):
+                    # Drop it from the index if it was stored before it became excluded
+                    if path in self.manifest.files:
+                        self.missing.append(path)
+                    continue
+                self.seen.add(path)
+                try:
+                    info = self.manifest.check(path, self.full)
+                except FileNotFoundError:
+                    if self.paths is not None:
+                        self.missing.append(path)
+                    continue
+                except OSError:
+                    continue
+                if info is None:
+                    self.stats["files_unchanged"] += 1
+                    continue
+                # Block while the parse stage is PIPELINE_QUEUE_SIZE files behind
+                while not file_slots.acquire(timeout=0.5):
+                    if self._stop.is_set():
+                        return
+                loop.call_soon_threadsafe(file_queue.put_nowait, (path, info))
+        finally:
+            loop.call_soon_threadsafe(file_queue.put_nowait, _DONE)
+
+    async def _changed_files(self, file_queue, file_slots):
+        while True:
+            item = await file_queue.get()
+            if item is _DONE:
+                return
+            file_slots.release()
+            path, info = item
+            self.file_info[path] = info
+            self.stats["files_changed"] += 1
+            yield path
+
+    # Stage 2: parse files on the process pool
+    async def _parse(self, file_queue, file_slots, chunk_queue):
+        async for path, chunks, error, seconds in chunk_files_parallel(self._changed_files(file_queue, file_slots)):
+            self._record_stage("chunk", seconds)
+            if error:
+                # Leave it out of the manifest so the next run retries it
+                print(f"Skipping {path}: {error}")
+                self.file_info.pop(path, None)
+                self.stats["files_failed"] += 1
+                continue
+            # Workspace-relative path, which query path filters match against
+            relative = os.path.relpath(path, self.workspace_dir).replace(os.sep, "/")
+            for c in chunks:
+                c["path"] = relative
+                if self.commit:
+                    c["commit"] = self.commit
+            await chunk_queue.put((path, chunks))
+        await chunk_queue.put(_DONE)
+
+    # Stage 3: group chunks into batches and embed a bounded number at once
+    async def _embed(self, chunk_queue, insert_queue):
+        semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+        in_flight = set()
+        batch = []
+
+        async def embed(batch):
+            try:
+                start = time.perf_counter()
+                embeddings = await embed_batch_with_retry([c["content"] for c in batch])
+                self._record_stage("embed", time.perf_counter() - start)
+                await insert_queue.put((batch, embeddings, []))
+            finally:
+                semaphore.release()
+
+        def on_done(task):
+            # Failed tasks stay in the set so the error is re-raised below
+            if task.cancelled() or task.exception() is None:
+                in_flight.discard(task)
+
+        async def flush():
+            for task in in_flight:
+                if task.done():
+                    task.result()
+            await semaphore.acquire()
+            task = asyncio.ensure_future(embed(batch[:EMBEDDING_BATCH_SIZE]))
+            task.add_done_callback(on_done)
+            in_flight.add(task)
+            del batch[:EMBEDDING_BATCH_SIZE]
+
+        try:
+            while True:
+                item = await chunk_queue.get()
+                if item is _DONE:
+                    break
+                path, chunks = item
+                self.remaining[path] = len(chunks)
+                self.chunk_ids[path] = []
+                if not chunks:
+                    await insert_queue.put(([], [], [path]))
+                    continue
+                batch.extend(chunks)
+                while len(batch) >= EMBEDDING_BATCH_SIZE:
+                    await flush()
+            while batch:
+                await flush()
+            await asyncio.gather(*in_flight)
+        finally:
+            for task in in_flight:
+                task.cancel()
+        await insert_queue.put(_DONE)
+
+    # Stage 4: write embedded batches to Chroma and checkpoint finished files
+    async def _insert(self, insert_queue):
+        finished = False
+        while not finished:
+            item = await insert_queue.get()
+            if item is _DONE:
+                break
+            items = [item]
+            # Coalesce whatever else is already waiting into one write
+            while not insert_queue.empty() and len(items) < EMBEDDING_CONCURRENCY * 2:
+                item = insert_queue.get_nowait()
+                if item is _DONE:
+                    finished = True
+                    break
+                items.append(item)
+            chunks = [c for batch, _, _ in items for c in batch]
+            embeddings = [e for _, batch_embeddings, _ in items for e in batch_embeddings]
+            empty_files = [path for _, _, paths in items for path in paths]
+            await run_ingest_io(self._commit, chunks, embeddings, empty_files)
+            self._record_progress(chunks, empty_files)
+            if self.manifest.dirty and time.monotonic() - self._last_save >= MANIFEST_SAVE_INTERVAL:
+                await run_ingest_io(self.manifest.save)
+                self._last_save = time.monotonic()
+
+    def _commit(self, chunks, embeddings, empty_files):
+        # Old chunks of a file are deleted right before its first new batch lands
+        new_files = [
+            path for path in dict.fromkeys([c["file"] for c in chunks] + empty_files)
+            if path not in self.started
+        ]
+        # Forget them first: a file whose old chunks are gone but whose new ones
+        # are not all in must be retried by the next run, even if unchanged
+        for path in new_files:
+            self.manifest.forget(path)
+        self._remove_files(new_files)
+        self.started.update(new_files)
+        if chunks:
+            result = insert_chunks(chunks, embeddings, self.repo_name)
+            self.lexical.add_chunks(chunks)
+            self._record_stage("insert", result["seconds"])
+        # Cached answers for this repository are stale from here on
+        bump_index_version(self.repo_name)
+
+    def _record_stage(self, stage, seconds):
+        self.stats[f"{stage}_seconds"] += seconds
+        STAGE_SECONDS.observe(seconds, stage=f"ingest_{stage}")
+
+    def _remove_files(self, paths):
+        delete_file_chunks(paths, self.repo_name)
+        self.lexical.remove_files(paths)
+
+    def _record_progress(self, chunks, empty_files):
+        for c in chunks:
+            path = c["file"]
+            self.chunk_ids[path].append(chunk_id(c))
+            self.remaining[path] -= 1
+        for path in dict.fromkeys([c["file"] for c in chunks] + empty_files):
+            if self.remaining[path] == 0:
+                self.manifest.record(path, *self.file_info.pop(path), self.chunk_ids.pop(path))
+                del self.remaining[path]
+                self.started.discard(path)
+        self.stats["chunks_inserted"] += len(chunks)
+        INGEST_CHUNKS.inc(len(chunks))
+        self._progress.update(len(chunks))
+
+async def run_ingest_pipeline(workspace_dir, repo_name=None, full=False, paths=None, commit=None):
+    """
+    Stream a workspace into its repository collection and return run stats.
+    With `paths`, only those files are checked: changed ones are re-ingested
+    and missing ones are removed from the index.
+    """
+    workspace_dir = os.path.abspath(workspace_dir)
+    if repo_name is None:
+        repo_name = os.path.basename(workspace_dir)
+    if paths is not None:
+        paths = [os.path.abspath(p) for p in paths]
+    pipeline = IngestPipeline(workspace_dir, repo_name, full=full, paths=paths, commit=commit)
+    stats = await pipeline.run()
+    print("Embedding cache:", get_cache_stats())
+    return stats
@@ -0,0 +1,166 @@
+import os
+import re
+import time
+from collections import OrderedDict
+import numpy as np
+
+from config import (
+    QUERY_EMBEDDING_CACHE_SIZE,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_SIMILARITY,
+)
+from embeddings import get_embedding, get_embeddings
+from manifest import manifest_path
+from search_filters import filter_key
+
+# In-process caches in front of the RAG round trip.
+# Question embeddings are kept in a small LRU, so a repeated question skips
+# the embedding server (and the SQLite embedding cache). Answers are cached
+# per (repository, template, normalized question, index version) with a
+# TTL; optionally a question whose embedding is close enough to a cached
+# one reuses that answer too. The index version changes whenever the
+# repository is re-ingested, so answers never outlive the code they were
+# generated from.
+
+class LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def pop(self, key):
+        self.entries.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+        }
+
+embedding_lru = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+answer_lru = LRUCache(ANSWER_CACHE_SIZE)
+
+## Index versions
+# Bumped in-process by every ingest write; the manifest's mtime covers
+# ingests run from another process (e.g. the CLI).
+_generations = {}
+
+def bump_index_version(repo_name):
+    _generations[repo_name] = _generations.get(repo_name, 0) + 1
+
+def index_version(repo_name):
+    try:
+        saved = os.stat(manifest_path(repo_name)).st_mtime_ns
+    except OSError:
+        saved = 0
+    return (_generations.get(repo_name, 0), saved)
+
+## Question embeddings
+async def get_question_embedding(question):
+    """get_embedding behind the in-process LRU"""
+    embedding = embedding_lru.get(question)
+    if embedding is None:
+        embedding = await get_embedding(question)
+        embedding_lru.put(question, embedding)
+    return embedding
+
+async def get_question_embeddings(questions):
+    """get_question_embedding for many questions, with one call for all the misses"""
+    embeddings = [embedding_lru.get(q) for q in questions]
+    missing = list(dict.fromkeys(q for q, e in zip(questions, embeddings) if e is None))
+    if missing:
+        fetched = dict(zip(missing, await get_embeddings(missing)))
+        for q, embedding in fetched.items():
+            embedding_lru.put(q, embedding)
+        embeddings = [fetched[q] if e is None else e for q, e in zip(questions, embeddings)]
+    return embeddings
+
+## Answers
+def normalize_question(question):
+    """Case, whitespace and trailing punctuation do not change the question"""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ").lower()
+
+def answer_key(repo_name, template_name, question, search_filter=None):
+    """repo_name may also be a tuple of repositories searched together"""
+    if isinstance(repo_name, tuple):
+        version = tuple(index_version(r) for r in repo_name)
+    else:
+        version = index_version(repo_name)
+    return (repo_name, template_name, normalize_question(question), version, filter_key(search_filter))
+
+def get_answer(key):
+    """Cached answer (whatever put_answer stored) for an exact key, or None"""
+    if ANSWER_CACHE_TTL <= 0:
+        return None
+    entry = answer_lru.get(key)
+    if entry is None:
+        return None
+    if entry["expires"] < time.time():
+        answer_lru.pop(key)
+        return None
+    return entry["answer"]
+
+def get_similar_answer(key, embedding):
+    """
+    Cached answer to a near-duplicate question: same repository, template and
+    index version, and a question embedding with cosine similarity of at
+    least ANSWER_CACHE_SIMILARITY. None when disabled or nothing is close.
+    """
+    if ANSWER_CACHE_TTL <= 0 or ANSWER_CACHE_SIMILARITY <= 0:
+        return None
+    now = time.time()
+    query = np.asarray(embedding, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+    best, best_score = None, ANSWER_CACHE_SIMILARITY
+    for other_key, entry in answer_lru.entries.items():
+        if other_key[:2] != key[:2] or other_key[3:] != key[3:] or entry["expires"] < now:
+            continue
+        if entry["embedding"] is None:
+            continue
+        score = float(np.dot(query, entry["embedding"]))
+        if score >= best_score:
+            best, best_score = other_key, score
+    if best is None:
+        return None
+    return answer_lru.get(best)["answer"]
+
+def put_answer(key, answer, embedding=None):
+    if ANSWER_CACHE_TTL <= 0:
+        return
+    if embedding is not None:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+    answer_lru.put(key, {
+        "answer": answer,
+        "embedding": embedding,
+        "expires": time.time() + ANSWER_CACHE_TTL,
+    })
+
+def get_query_cache_stats():
+    return {
+        "embeddings": embedding_lru.stats(),
+        "answers": answer_lru.stats(),
+    }
@@ -1,8 +1,13 @@
 import asyncio
-from embeddings import get_embedding
-from milvusdb import semantic_search
-import httpx
-from config import LLM_API_URL
+import functools
+import json
+from config import LLM_API_URL, QUERY_BATCH_SIZE, BATCH_LLM_CONCURRENCY
+from http_clients import get_llm_client
+from query_cache import answer_key, get_answer, get_similar_answer, put_answer
+from retrieval import retrieve, retrieve_across, retrieve_many, resolve_repositories
+from context_packer import pack_context, context_budget
+from singleflight import SingleFlight
+from metrics import timed
 import os
 
 def load_prompt_template(template_name):
@@ -18,7 +23,7 @@ def load_prompt_template(template_name):
         # Return a default template if file not found
         return "You are a helpful AI assistant.\n\nContext:\n{context}\n\nQuestion:\n{question}"
 
-async def call_llm(context, question, template_name="code_qa_template"):
+def _chat_payload(context, question, template_name):
     # Load the prompt template
     prompt_template = load_prompt_template(template_name)
     
@@ -29,10 +34,7 @@ async def call_llm(context, question, template_name="code_qa_template"):
     system_prompt_line = prompt_template.split('\n', 1)[0]
     system_prompt = system_prompt_line if not system_prompt_line.startswith('{') else "You are a helpful assistant."
     
-    headers = {
-        "Content-Type": "application/json"
-    }
-    payload = {
+    return {
         "model": "gpt-4",
         "messages": [
             {"role": "system", "content": system_prompt},
@@ -40,19 +42,218 @@ async def call_llm(context, question, template_name="code_qa_template"):
         ],
         "temperature": 0.7
     }
-    async with httpx.AsyncClient(timeout=120) as client:
-        resp = await client.post(LLM_API_URL, headers=headers, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
-        return data["choices"][0]["message"]["content"]
-
-async def rag_ask(question, repo_name=None, template_name="code_qa_template"):
-    embedding = await get_embedding(question)
-    hits = semantic_search(embedding, top_k=5, repo_name=repo_name)
-    context = "\n\n".join([f"File: {h['file']}:{h['start_line']}\n{h['content']}" for h in hits])
-    answer = await call_llm(context, question, template_name)
+
+async def call_llm(context, question, template_name="code_qa_template"):
+    headers = {
+        "Content-Type": "application/json"
+    }
+    payload = _chat_payload(context, question, template_name)
+    client = get_llm_client()
+    resp = await client.post(LLM_API_URL, headers=headers, json=payload)
+    resp.raise_for_status()
+    data = resp.json()
+    return data["choices"][0]["message"]["content"]
+
+async def iter_sse_data(response):
+    """
+    Decode a text/event-stream response incrementally, line by line, yielding
+    the data of each event (multi-line data joined with newlines).
+    """
+    data_lines = []
+    async for line in response.aiter_lines():
+        if not line:
+            # A blank line ends the event
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if field == "data":
+            data_lines.append(value[1:] if value.startswith(" ") else value)
+    if data_lines:
+        yield "\n".join(data_lines)
+
+async def stream_llm(context, question, template_name="code_qa_template"):
+    """Like call_llm, but yields the answer's content deltas as they arrive"""
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream"
+    }
+    payload = {**_chat_payload(context, question, template_name), "stream": True}
+    client = get_llm_client()
+    async with client.stream("POST", LLM_API_URL, headers=headers, json=payload) as response:
+        response.raise_for_status()
+        async for data in iter_sse_data(response):
+            if data == "[DONE]":
+                break
+            try:
+                delta = json.loads(data).get("choices", [{}])[0].get("delta", {})
+            except (json.JSONDecodeError, AttributeError, IndexError):
+                # Skip anything that is not a completion chunk
+                continue
+            content = delta.get("content")
+            if content:
+                yield content
+
+def _format_hit(hit):
+    header = f"File: {hit['file']}:{hit['start_line']}"
+    if hit.get("repository"):
+        # Cross-repository search: say where each chunk came from
+        header += f" (repository: {hit['repository']})"
+    return f"{header}\n{hit['content']}"
+
+# Identical questions asked at the same time share one retrieval and generation
+query_flights = SingleFlight()
+
+async def rag_ask(question, repo_name=None, template_name="code_qa_template", repositories=None,
+                  search_filter=None):
+    """
+    Answer a question about one repository, or with `repositories` (a list of
+    names, or ["*"] for all) about several at once. `search_filter`
+    (search_filters.make_filter) limits which chunks can be retrieved.
+    """
+    result = await rag_answer(question, repo_name, template_name, repositories, search_filter)
     # Return the answer instead of printing it
-    return answer
+    return result["answer"]
+
+async def rag_answer(question, repo_name=None, template_name="code_qa_template", repositories=None,
+                     search_filter=None):
+    """
+    rag_ask, returning {"answer", "context_tokens", "cached"}, plus the
+    seconds spent per stage as "timings" when the answer was not cached
+    """
+    if repositories:
+        repo_name = tuple(await resolve_repositories(repositories))
+    # Answers are cached until the repository is re-ingested (or they expire)
+    key = answer_key(repo_name, template_name, question, search_filter)
+    result = get_answer(key)
+    if result is not None:
+        return {**result, "cached": True}
+    return await query_flights.do(
+        key, lambda: _answer(key, question, repo_name, template_name, search_filter)
+    )
+
+async def _answer(key, question, repo_name, template_name, search_filter=None):
+    timings = {}
+    if isinstance(repo_name, tuple):
+        hits, embedding = await retrieve_across(
+            question, list(repo_name), top_k=5, timings=timings, search_filter=search_filter
+        )
+    else:
+        hits, embedding = await retrieve(
+            question, repo_name, top_k=5, timings=timings, search_filter=search_filter
+        )
+    return await _generate(key, question, hits, embedding, template_name, timings)
+
+async def _generate(key, question, hits, embedding, template_name, timings=None):
+    """The answer from retrieved hits, unless a near-duplicate question was answered already"""
+    if timings is None:
+        timings = {}
+    if embedding is not None:
+        result = get_similar_answer(key, embedding)
+        if result is not None:
+            return {**result, "cached": True, "timings": timings}
+    with timed(timings, "prompt_build"):
+        context, context_tokens, _ = pack_context(hits, _format_hit, context_budget(template_name))
+    with timed(timings, "llm_total"):
+        answer = await call_llm(context, question, template_name)
+    result = {"answer": answer, "context_tokens": context_tokens}
+    # Timings describe this run only; they are not cached with the answer
+    put_answer(key, result, embedding)
+    return {**result, "cached": False, "timings": timings}
+
+async def rag_answer_batch(questions, repo_name=None, template_name="code_qa_template",
+                           concurrency=BATCH_LLM_CONCURRENCY, search_filter=None):
+    """
+    rag_answer for many questions about one repository, yielding results in
+    the order asked. Questions are retrieved QUERY_BATCH_SIZE at a time (one
+    embedding call and one vector query per group) and at most `concurrency`
+    LLM calls run at once. A question that fails yields {"error": ...}.
+    """
+    loop = asyncio.get_running_loop()
+    results = [loop.create_future() for _ in questions]
+    producer = asyncio.ensure_future(
+        _answer_batch(
+            questions, repo_name, template_name, results, asyncio.Semaphore(concurrency), search_filter
+        )
+    )
+    try:
+        for result in results:
+            yield await result
+    finally:
+        producer.cancel()
+
+async def _answer_batch(questions, repo_name, template_name, results, llm_slots, search_filter=None):
+    tasks = []
+    error = "Query was not answered"
+    try:
+        for start in range(0, len(questions), QUERY_BATCH_SIZE):
+            todo = []
+            for i in range(start, min(start + QUERY_BATCH_SIZE, len(questions))):
+                key = answer_key(repo_name, template_name, questions[i], search_filter)
+                cached = get_answer(key)
+                if cached is not None:
+                    results[i].set_result({**cached, "cached": True})
+                else:
+                    todo.append((i, key))
+            if not todo:
+                continue
+            try:
+                retrieved = await retrieve_many(
+                    [questions[i] for i, _ in todo], repo_name, top_k=5, search_filter=search_filter
+                )
+            except Exception as e:
+                for i, _ in todo:
+                    results[i].set_result({"error": f"Retrieval failed: {e}"})
+                continue
+            if len(retrieved) != len(todo):
+                for i, _ in todo:
+                    results[i].set_result(
+                        {"error": f"Retrieval failed: {len(retrieved)} results for {len(todo)} questions"}
+                    )
+                continue
+            for (i, key), (hits, embedding) in zip(todo, retrieved):
+                task = asyncio.ensure_future(_generate_in_batch(
+                    key, questions[i], hits, embedding, template_name, llm_slots
+                ))
+                task.add_done_callback(functools.partial(_deliver, results[i]))
+                tasks.append(task)
+        await asyncio.gather(*tasks)
+    except Exception as e:
+        print(f"Error answering batch: {e}")
+        error = f"Error processing query: {e}"
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Whatever stopped the batch, no consumer may be left waiting on a result
+        for result in results:
+            if not result.done():
+                result.set_result({"error": error})
+
+def _deliver(result, task):
+    """Pass a finished generation task's outcome to its result future, unless that was abandoned"""
+    if task.cancelled() or result.done():
+        # A consumer cancelled while awaiting the future cancels the future too
+        return
+    if task.exception() is not None:
+        result.set_exception(task.exception())
+    else:
+        result.set_result(task.result())
+
+async def _generate_in_batch(key, question, hits, embedding, template_name, llm_slots):
+    try:
+        async with llm_slots:
+            # An earlier copy of the same question may have been answered meanwhile
+            result = get_answer(key)
+            if result is not None:
+                return {**result, "cached": True}
+            return await query_flights.do(
+                key, lambda: _generate(key, question, hits, embedding, template_name)
+            )
+    except Exception as e:
+        return {"error": f"Error processing query: {e}"}
 
 if __name__ == "__main__":
     import sys
@@ -61,8 +262,13 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Ask questions about your code repository")
     parser.add_argument("question", help="The question to ask about your code")
     parser.add_argument("-r", "--repository", help="Repository name to query (defaults to most recent)")
+    parser.add_argument("--repositories", nargs="+",
+                       help="Search several repositories at once ('*' for every ingested one)")
     parser.add_argument("-t", "--template", default="code_qa_template", 
                        help="Name of prompt template file to use (without .txt extension)")
+    parser.add_argument("--path", help="Only search under this path prefix or glob")
+    parser.add_argument("--type", dest="chunk_type", help="Only search chunks of this type (function, class)")
+    parser.add_argument("--language", help="Only search files in this language")
     
     args = parser.parse_args()
     
@@ -70,4 +276,6 @@ if __name__ == "__main__":
     prompts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
     os.makedirs(prompts_dir, exist_ok=True)
     
-    asyncio.run(rag_ask(args.question, args.repository, args.template))
+    from search_filters import make_filter
+    search_filter = make_filter(path=args.path, chunk_type=args.chunk_type, language=args.language)
+    asyncio.run(rag_ask(args.question, args.repository, args.template, args.repositories, search_filter))
@@ -0,0 +1,206 @@
+import asyncio
+import heapq
+import itertools
+
+from config import HYBRID_SEARCH, RRF_K, SYMBOL_SKIPS_EMBEDDING, FANOUT_SEARCH_TIMEOUT
+from executors import run_search
+from lexical_index import get_lexical_index, query_symbols
+from milvusdb import semantic_search, semantic_search_many, get_chunks, chunk_id, list_repository_names
+from query_cache import get_question_embedding, get_question_embeddings
+from metrics import timed
+
+# Hybrid retrieval for the query path.
+# A question is searched both lexically (BM25 over names, paths and code
+# tokens) and by embedding, and the two rankings are merged with reciprocal
+# rank fusion. Definitions whose exact name appears in the question rank
+# first; when there are any, the lexical results alone answer the question
+# and the embedding round trip is skipped. Across several repositories,
+# every collection is searched concurrently with one shared embedding. A
+# batch of questions shares one embedding call and one vector query.
+# A search filter (search_filters.make_filter) is applied inside the vector
+# store; lexical candidates are checked against it before fusion.
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merge ranked id lists; an id scores the sum of 1 / (k + rank) over the lists"""
+    scores = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, 1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def _symbol_matches(question, repo_name):
+    return get_lexical_index(repo_name).find_symbols(query_symbols(question))
+
+def _bm25_ranking(question, repo_name, top_k):
+    return [cid for cid, _ in get_lexical_index(repo_name).search(question, top_k)]
+
+def _lexical_rankings(questions, repo_name, top_k):
+    """(symbol matches, BM25 ranking) for each question"""
+    return [
+        (_symbol_matches(q, repo_name), _bm25_ranking(q, repo_name, top_k))
+        for q in questions
+    ]
+
+def _fuse(vector_hits, lexical_ids, top_k):
+    """Fused top_k ids, plus the vector hits by id (lexical-only ids still need fetching)"""
+    hits_by_id = {chunk_id(h): h for h in vector_hits}
+    fused = reciprocal_rank_fusion([
+        [chunk_id(h) for h in vector_hits],
+        lexical_ids,
+    ])[:top_k]
+    return fused, hits_by_id
+
+def _filter_ids(ids, repo_name, search_filter):
+    """The lexical candidates that pass a filter, and their chunks by id"""
+    hits = get_chunks(ids, repo_name, search_filter)
+    hits_by_id = {chunk_id(h): h for h in hits}
+    return [cid for cid in ids if cid in hits_by_id], hits_by_id
+
+async def _timed(timings, stage, awaitable):
+    """Await, adding the seconds it took to timings[stage] and the stage histogram"""
+    with timed(timings, stage):
+        return await awaitable
+
+async def _vector_hits(question, repo_name, top_k, timings, search_filter=None):
+    embedding = await _timed(timings, "embedding", get_question_embedding(question))
+    hits = await _timed(timings, "vector_search", run_search(
+        semantic_search, embedding, top_k=top_k, repo_name=repo_name, search_filter=search_filter
+    ))
+    return hits, embedding
+
+async def retrieve(question, repo_name=None, top_k=5, timings=None, search_filter=None):
+    """
+    The top_k chunks for a question, as search hits. Returns (hits, embedding);
+    the embedding is None when no embedding call was needed. Seconds spent per
+    stage are added to `timings` if given. Only chunks passing `search_filter`
+    are returned.
+    """
+    if timings is None:
+        timings = {}
+    if not HYBRID_SEARCH:
+        return await _vector_hits(question, repo_name, top_k, timings, search_filter)
+
+    symbol_ids = await _timed(timings, "lexical_search", run_search(_symbol_matches, question, repo_name))
+    known = {}
+    if search_filter and symbol_ids:
+        symbol_ids, known = await run_search(_filter_ids, symbol_ids, repo_name, search_filter)
+    if symbol_ids and SYMBOL_SKIPS_EMBEDDING:
+        bm25_ids = await _timed(timings, "lexical_search", run_search(_bm25_ranking, question, repo_name, top_k))
+        ids = list(dict.fromkeys(symbol_ids + bm25_ids))[:top_k]
+        return await run_search(get_chunks, ids, repo_name, search_filter), None
+
+    # Both searches fetch extra candidates so the fused top_k has room to agree
+    bm25_ids, (vector_hits, embedding) = await asyncio.gather(
+        _timed(timings, "lexical_search", run_search(_bm25_ranking, question, repo_name, top_k * 2)),
+        _vector_hits(question, repo_name, top_k * 2, timings, search_filter),
+    )
+    lexical_ids = list(dict.fromkeys(symbol_ids + bm25_ids))
+    if search_filter:
+        lexical_ids, filtered = await run_search(_filter_ids, lexical_ids, repo_name, search_filter)
+        known.update(filtered)
+    fused, hits_by_id = _fuse(vector_hits, lexical_ids, top_k)
+    hits_by_id = {**known, **hits_by_id}
+    missing = [cid for cid in fused if cid not in hits_by_id]
+    for hit in await run_search(get_chunks, missing, repo_name):
+        hits_by_id[chunk_id(hit)] = hit
+    return [hits_by_id[cid] for cid in fused if cid in hits_by_id], embedding
+
+async def retrieve_many(questions, repo_name=None, top_k=5, search_filter=None, timings=None):
+    """
+    retrieve() for a batch of questions against one repository: one lexical
+    pass, one embedding call and one vector query for all of them. Returns
+    a list of (hits, embedding), one per question.
+    """
+    if timings is None:
+        timings = {}
+    n = len(questions)
+    lexical = [([], [])] * n
+    known = {}
+    if HYBRID_SEARCH:
+        lexical = await _timed(timings, "lexical_search", run_search(
+            _lexical_rankings, questions, repo_name, top_k * 2
+        ))
+        if search_filter:
+            # One fetch checks every lexical candidate of the batch
+            candidates = list(dict.fromkeys(
+                cid for symbol_ids, bm25_ids in lexical for cid in symbol_ids + bm25_ids
+            ))
+            _, known = await run_search(_filter_ids, candidates, repo_name, search_filter)
+            lexical = [
+                ([cid for cid in symbol_ids if cid in known], [cid for cid in bm25_ids if cid in known])
+                for symbol_ids, bm25_ids in lexical
+            ]
+    skip = [HYBRID_SEARCH and SYMBOL_SKIPS_EMBEDDING and bool(symbol_ids) for symbol_ids, _ in lexical]
+
+    embed = [i for i in range(n) if not skip[i]]
+    embeddings, vector_hits = [None] * n, [[] for _ in range(n)]
+    if embed:
+        fetched = await _timed(timings, "embedding", get_question_embeddings([questions[i] for i in embed]))
+        searched = await _timed(timings, "vector_search", run_search(
+            semantic_search_many, fetched,
+            top_k=top_k * 2 if HYBRID_SEARCH else top_k, repo_name=repo_name,
+            search_filter=search_filter
+        ))
+        for i, embedding, hits in zip(embed, fetched, searched):
+            embeddings[i], vector_hits[i] = embedding, hits
+    if not HYBRID_SEARCH:
+        return list(zip(vector_hits, embeddings))
+
+    fused = []
+    for i, (symbol_ids, bm25_ids) in enumerate(lexical):
+        lexical_ids = list(dict.fromkeys(symbol_ids + bm25_ids))
+        if skip[i]:
+            fused.append(lexical_ids[:top_k])
+            continue
+        ids, hits_by_id = _fuse(vector_hits[i], lexical_ids, top_k)
+        fused.append(ids)
+        known.update(hits_by_id)
+    # Chunks only the lexical index found, fetched once for the whole batch
+    missing = list(dict.fromkeys(cid for ids in fused for cid in ids if cid not in known))
+    for hit in await run_search(get_chunks, missing, repo_name):
+        known[chunk_id(hit)] = hit
+    return [
+        ([known[cid] for cid in ids if cid in known], embedding)
+        for ids, embedding in zip(fused, embeddings)
+    ]
+
+async def resolve_repositories(repositories):
+    """Expand "*" to every ingested repository, dropping duplicates"""
+    if "*" in repositories:
+        return sorted(await run_search(list_repository_names))
+    return list(dict.fromkeys(repositories))
+
+async def _search_repository(repo_name, embedding, top_k, search_filter=None):
+    try:
+        hits = await asyncio.wait_for(
+            run_search(
+                semantic_search, embedding, top_k=top_k, repo_name=repo_name, search_filter=search_filter
+            ),
+            FANOUT_SEARCH_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        print(f"Search in {repo_name} took over {FANOUT_SEARCH_TIMEOUT}s; leaving it out")
+        return []
+    except Exception as e:
+        print(f"Search in {repo_name} failed; leaving it out: {e}")
+        return []
+    for h in hits:
+        h["repository"] = repo_name
+    return hits
+
+async def retrieve_across(question, repositories, top_k=5, timings=None, search_filter=None):
+    """
+    The global top_k chunks across several repositories, each hit tagged with
+    its "repository". A collection that is slow or fails is left out rather
+    than holding up the rest. Returns (hits, embedding).
+    """
+    if timings is None:
+        timings = {}
+    embedding = await _timed(timings, "embedding", get_question_embedding(question))
+    results = await _timed(timings, "vector_search", asyncio.gather(*[
+        _search_repository(repo_name, embedding, top_k, search_filter) for repo_name in repositories
+    ]))
+    # Each list is already sorted by distance: a k-way heap merge only has to
+    # look at the head of each one to produce the global top_k
+    merged = heapq.merge(*results, key=lambda h: h["distance"])
+    return list(itertools.islice(merged, top_k)), embedding
@@ -2,10 +2,11 @@ from fastapi import APIRouter, HTTPException, BackgroundTasks
 import os
 import time
 
-from models.requests import IngestRequest, IngestFileRequest
-from models.responses import IngestStatus
+from models.requests import IngestRequest, IngestFileRequest, WatchRequest
+from models.responses import IngestStatus, WatchStatus, WatchListResponse
 from ingest import process_workspace, process_file
 from services.task_manager import create_task, update_task_status, get_task_status
+from services.watch_manager import start_watch, stop_watch, list_watches
 
 router = APIRouter()
 
@@ -25,7 +26,9 @@ async def ingest_workspace(request: IngestRequest, background_tasks: BackgroundT
         _ingest_workspace_bg,
         request.workspace_path,
         repository_name,
-        task_id
+        task_id,
+        request.full_reindex,
+        request.use_git
     )
     
     task_status = get_task_status(task_id)
@@ -79,13 +82,43 @@ async def get_ingestion_status(task_id: str):
         timestamp=task_status["timestamp"]
     )
 
+@router.post("/ingest/watch", response_model=WatchStatus)
+async def start_watching(request: WatchRequest):
+    """
+    Keep a repository's index in sync with a workspace: changed files are
+    re-ingested within seconds of being saved.
+    """
+    if not os.path.isdir(request.workspace_path):
+        raise HTTPException(status_code=400, detail=f"Directory not found: {request.workspace_path}")
+    
+    repository_name = request.repository_name or os.path.basename(os.path.abspath(request.workspace_path))
+    watch = start_watch(request.workspace_path, repository_name)
+    return WatchStatus(**watch)
+
+@router.get("/ingest/watch", response_model=WatchListResponse)
+async def get_watches():
+    """
+    List running workspace watchers.
+    """
+    return WatchListResponse(watches=[WatchStatus(**watch) for watch in list_watches()])
+
+@router.delete("/ingest/watch/{repository_name}")
+async def unwatch_workspace(repository_name: str):
+    """
+    Stop watching a repository's workspace.
+    """
+    if not await stop_watch(repository_name):
+        raise HTTPException(status_code=404, detail=f"Repository is not being watched: {repository_name}")
+    return {"status": "stopped", "repository": repository_name}
+
 # Background task functions
-async def _ingest_workspace_bg(workspace_path: str, repository_name: str, task_id: str):
+async def _ingest_workspace_bg(workspace_path: str, repository_name: str, task_id: str,
+                               full_reindex: bool = False, use_git: bool = False):
     """Background task for workspace ingestion"""
     try:
         update_task_status(task_id, "processing", f"Processing workspace: {workspace_path}")
         
-        await process_workspace(workspace_path)
+        await process_workspace(workspace_path, repository_name, full=full_reindex, git=use_git)
         
         update_task_status(task_id, "completed", f"Successfully ingested {repository_name}")
     except Exception as e:
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from metrics import render
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Stage latency histograms and query/ingest counters in the Prometheus text format.
+    """
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
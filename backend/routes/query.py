@@ -1,40 +1,212 @@
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+from starlette.requests import ClientDisconnect
 import time
 import json
 import asyncio
 
-from models.requests import QueryRequest
+from config import QUERY_TIMEOUT, DISCONNECT_POLL_INTERVAL
+from models.requests import QueryRequest, BatchQueryRequest
 from models.responses import QueryResponse
-from rag_llm import rag_ask
+from rag_llm import rag_answer, rag_answer_batch, stream_llm
+from query_cache import answer_key
+from singleflight import StreamBroadcast
+from retrieval import retrieve, retrieve_across, resolve_repositories
+from context_packer import pack_context, context_budget
+from search_filters import make_filter
+from metrics import timed, record, record_query, server_timing
 
 router = APIRouter()
 
+async def _until_disconnected(http_request):
+    """Return once the client has gone away"""
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+async def _unless_disconnected(awaitable, disconnected, timeout=None):
+    """
+    Await `awaitable`, but cancel it (and whatever embedding, search or LLM
+    call it is waiting on) if the `disconnected` future completes first or
+    `timeout` seconds pass. Raises ClientDisconnect or asyncio.TimeoutError.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        done, _ = await asyncio.wait(
+            {task, disconnected}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+    except asyncio.CancelledError:
+        # The server noticed the disconnect first and cancelled us
+        task.cancel()
+        raise
+    if task in done:
+        return task.result()
+    task.cancel()
+    try:
+        # Let it unwind (e.g. close the upstream HTTP stream) before moving on
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+    if disconnected in done:
+        raise ClientDisconnect()
+    raise asyncio.TimeoutError()
+
+def _search_filter(request):
+    """The metadata filter a query request asks for, or None"""
+    return make_filter(
+        path=request.path,
+        chunk_type=request.chunk_type,
+        symbol=request.symbol,
+        language=request.language,
+        contains=request.contains,
+    )
+
 @router.post("/query", response_model=QueryResponse)
-async def query(request: QueryRequest):
+async def query(request: QueryRequest, http_request: Request, response: Response):
     """
     Query the RAG system with a question about a specific repository.
+    Stage timings come back in "timings" and the Server-Timing header.
     """
     start_time = time.time()
+    disconnected = asyncio.ensure_future(_until_disconnected(http_request))
     try:
-        result = await rag_ask(
-            question=request.question,
-            repo_name=request.repository,
-            template_name=request.template_name
+        result = await _unless_disconnected(
+            rag_answer(
+                question=request.question,
+                repo_name=request.repository,
+                template_name=request.template_name,
+                repositories=request.repositories,
+                search_filter=_search_filter(request)
+            ),
+            disconnected,
+            timeout=QUERY_TIMEOUT or None
         )
         execution_time = time.time() - start_time
+        timings = {**result.get("timings", {}), "total": execution_time}
+        response.headers["Server-Timing"] = server_timing(timings)
+        record_query("query", "cached" if result["cached"] else "ok", execution_time)
         return QueryResponse(
-            answer=result,
+            answer=result["answer"],
             repository=request.repository,
-            execution_time=execution_time
+            repositories=request.repositories,
+            execution_time=execution_time,
+            context_tokens=result.get("context_tokens"),
+            cached=result["cached"],
+            timings=timings
         )
+    except ClientDisconnect:
+        # Nobody is left to read the answer
+        record_query("query", "disconnected")
+        return Response(status_code=499)
+    except asyncio.TimeoutError:
+        record_query("query", "timeout")
+        raise HTTPException(status_code=504, detail=f"Query took longer than {QUERY_TIMEOUT:g}s")
     except Exception as e:
+        record_query("query", "error")
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+    finally:
+        disconnected.cancel()
+
+@router.post("/query/batch")
+async def query_batch(request: BatchQueryRequest, http_request: Request):
+    """
+    Answer many questions about one repository. Results are streamed as
+    NDJSON, one line per question in the order they were asked, each with
+    its "index" and either an "answer" or an "error".
+    """
+    start_time = time.time()
+    print(f"Received batch of {len(request.questions)} questions, repository={request.repository}")
+
+    async def result_generator():
+        results = rag_answer_batch(
+            request.questions, request.repository, request.template_name,
+            search_filter=_search_filter(request)
+        )
+        disconnected = asyncio.ensure_future(_until_disconnected(http_request))
+        try:
+            for index, question in enumerate(request.questions):
+                result = await _unless_disconnected(results.__anext__(), disconnected)
+                yield json.dumps({"index": index, "question": question, **result}) + "\n"
+            record_query("batch", "ok", time.time() - start_time)
+        except ClientDisconnect:
+            record_query("batch", "disconnected")
+            print(f"Client disconnected after {time.time() - start_time:.2f}s; stopped the batch")
+        finally:
+            disconnected.cancel()
+            if not results.ag_running:
+                await results.aclose()
+
+    return StreamingResponse(
+        result_generator(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _format_hit(hit):
+    # Format in a way that's easily parseable by the regex in ContextDialog
+    return f"**File: {hit['file']}:{hit['start_line']}**\n```\n{hit['content'].strip()}\n```"
+
+# Identical concurrent stream requests share one upstream generation
+stream_flights = StreamBroadcast()
+
+def _source(hit):
+    return {
+        "file": hit["file"],
+        "start_line": hit.get("start_line"),
+        "end_line": hit.get("end_line"),
+        "name": hit.get("name"),
+        "type": hit.get("type"),
+        "repository": hit.get("repository"),
+    }
+
+async def _answer_events(question, repository, template_name, search_filter=None):
+    """
+    Retrieval and LLM generation for one question, as a sequence of events:
+    first {"type": "sources"}, then "content" deltas (or an "error"), then
+    {"type": "timings"} for the LLM stages. Shared by every subscriber
+    asking the same question at the same time. `repository` is a tuple of
+    names for a cross-repository search.
+    """
+    timings = {}
+    start = time.perf_counter()
+    if isinstance(repository, tuple):
+        hits, _ = await retrieve_across(
+            question, list(repository), top_k=5, timings=timings, search_filter=search_filter
+        )
+    else:
+        hits, _ = await retrieve(question, repository, top_k=5, timings=timings, search_filter=search_filter)
+    timings["retrieval"] = time.perf_counter() - start
+    with timed(timings, "prompt_build"):
+        context, context_tokens, packed = pack_context(hits, _format_hit, context_budget(template_name))
+    yield {
+        "type": "sources",
+        "sources": [_source(hit) for hit in packed],
+        "context_tokens": context_tokens,
+        "timings": timings,
+        "context": context,
+    }
+
+    llm_timings = {}
+    start = time.perf_counter()
+    try:
+        async for content in stream_llm(context, question, template_name):
+            if not llm_timings:
+                record(llm_timings, "llm_first_token", time.perf_counter() - start)
+            yield {"type": "content", "content": content}
+        record(llm_timings, "llm_total", time.perf_counter() - start)
+    except Exception as e:
+        print(f"Error during streaming: {e}")
+        # Send error notification to client
+        yield {"type": "error", "content": f"Error during streaming: {str(e)}"}
+    yield {"type": "timings", "timings": llm_timings}
 
 @router.post("/query/stream")
-async def query_stream(request: QueryRequest):
+async def query_stream(request: QueryRequest, http_request: Request):
     """
     Stream query results from the RAG system.
+    The response starts right away; retrieval and generation happen while
+    it is open, so clients see the "start" event before any search is done.
+    If the client disconnects, this request stops waiting on the upstream
+    work, which is cancelled once no other request shares it.
     """
     start_time = time.time()
     
@@ -42,143 +214,110 @@ async def query_stream(request: QueryRequest):
     print(f"Received request: question='{request.question}', repository={request.repository}")
     print(f"include_context={request.include_context} (type: {type(request.include_context)}, value in dict: {request.dict()['include_context']})")
     
-    try:
-        # Get context first (this remains the same)
-        from embeddings import get_embedding
-        from milvusdb import semantic_search
-        
-        embedding = await get_embedding(request.question)
-        hits = semantic_search(embedding, top_k=5, repo_name=request.repository)
-        
-        # Format context with better readability for parsing by ContextDialog
-        context_parts = []
-        for h in hits:
-            file_path = h['file']
-            line_number = h['start_line']
-            content = h['content'].strip()
-            # Format in a way that's easily parseable by the regex in ContextDialog
-            context_parts.append(f"**File: {file_path}:{line_number}**\n```\n{content}\n```")
+    # Function to stream the response
+    async def response_generator():
+        # Send initial message
+        init_message = json.dumps({
+            "type": "start",
+            "repository": request.repository,
+            "repositories": request.repositories,
+            "timestamp": time.time()
+        }) + "\n"
+        yield init_message
         
-        context = "\n\n".join(context_parts)
-        
-        # Function to stream the response
-        async def response_generator():
-            # Send initial message
-            init_message = json.dumps({
-                "type": "start",
-                "repository": request.repository,
-                "timestamp": time.time()
+        sources = None
+        first_token = None
+        llm_timings = {}
+        outcome = "ok"
+        events = None
+        disconnected = asyncio.ensure_future(_until_disconnected(http_request))
+        try:
+            scope = request.repository
+            if request.repositories:
+                scope = tuple(await _unless_disconnected(
+                    resolve_repositories(request.repositories), disconnected
+                ))
+            search_filter = _search_filter(request)
+            key = answer_key(scope, request.template_name, request.question, search_filter)
+            events = stream_flights.subscribe(
+                key,
+                lambda: _answer_events(request.question, scope, request.template_name, search_filter)
+            )
+            while True:
+                try:
+                    event = await _unless_disconnected(events.__anext__(), disconnected)
+                except StopAsyncIteration:
+                    break
+                if event["type"] == "timings":
+                    # Folded into the end event rather than sent on its own
+                    llm_timings = event["timings"]
+                    continue
+                if event["type"] == "sources":
+                    sources = event
+                    # The context text itself is only sent at the end, if asked for
+                    event = {k: v for k, v in event.items() if k != "context"}
+                elif event["type"] == "content" and first_token is None:
+                    first_token = time.time() - start_time
+                elif event["type"] == "error":
+                    outcome = "error"
+                # Stream the content (or an error notification) to the client
+                yield json.dumps(event) + "\n"
+        except ClientDisconnect:
+            record_query("stream", "disconnected")
+            print(f"Client disconnected after {time.time() - start_time:.2f}s; stopped streaming")
+            return
+        except Exception as e:
+            outcome = "error"
+            print(f"Error during streaming: {e}")
+            error_message = json.dumps({
+                "type": "error",
+                "content": f"Error during streaming: {str(e)}"
             }) + "\n"
-            yield init_message
-            
-            # Stream the response from LLM
-            from config import LLM_API_URL
-            import httpx
-            from rag_llm import load_prompt_template
-            
-            # Load the prompt template
-            prompt_template = load_prompt_template(request.template_name)
-            
-            # Format the template with context and question
-            user_prompt = prompt_template.format(context=context, question=request.question)
-            
-            # Extract system prompt - first line of the template
-            system_prompt_line = prompt_template.split('\n', 1)[0]
-            system_prompt = system_prompt_line if not system_prompt_line.startswith('{') else "You are a helpful assistant."
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Accept": "text/event-stream"
-            }
-            
-            payload = {
-                "model": "gpt-4",
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "temperature": 0.7,
-                "stream": True
+            yield error_message
+        finally:
+            disconnected.cancel()
+            # Drop this subscriber even when the response is abandoned mid-stream
+            # (a cancelled __anext__ still running cleans up after itself)
+            if events is not None and not events.ag_running:
+                await events.aclose()
+        
+        # Send completion message with timing info
+        execution_time = time.time() - start_time
+        record_query("stream", outcome, execution_time)
+        end_message = json.dumps({
+            "type": "end",
+            "execution_time": execution_time,
+            "context_tokens": sources["context_tokens"] if sources else None,
+            "timings": {
+                **(sources["timings"] if sources else {}),
+                **llm_timings,
+                "first_token": first_token,
+                "total": execution_time,
             }
-            
-            try:
-                async with httpx.AsyncClient(timeout=120) as client:
-                    async with client.stream("POST", LLM_API_URL, headers=headers, json=payload) as response:
-                        response.raise_for_status()
-                        buffer = ""
-                        async for chunk in response.aiter_text():
-                            buffer += chunk
-                            while "data:" in buffer:
-                                # Extract data
-                                parts = buffer.split("data:", 1)
-                                before = parts[0]
-                                parts = parts[1].split("\n", 1)
-                                data = parts[0].strip()
-                                
-                                # Reset buffer with the remainder
-                                buffer = parts[1] if len(parts) > 1 else ""
-                                
-                                # Handle special case for "[DONE]"
-                                if data == "[DONE]":
-                                    continue
-                                    
-                                try:
-                                    json_data = json.loads(data)
-                                    delta = json_data.get("choices", [{}])[0].get("delta", {})
-                                    content = delta.get("content", "")
-                                    
-                                    if content:
-                                        # Stream the content to the client
-                                        output = json.dumps({
-                                            "type": "content",
-                                            "content": content
-                                        }) + "\n"
-                                        yield output
-                                except json.JSONDecodeError as e:
-                                    # Try to recover
-                                    continue
-            except Exception as e:
-                print(f"Error during streaming: {e}")
-                # Send error notification to client
-                error_message = json.dumps({
-                    "type": "error",
-                    "content": f"Error during streaming: {str(e)}"
-                }) + "\n"
-                yield error_message
-            
-            # Send completion message with timing info
-            execution_time = time.time() - start_time
-            end_message = json.dumps({
-                "type": "end",
-                "execution_time": execution_time
+        }) + "\n"
+        yield end_message
+        
+        # Check include_context - convert to boolean again for extra safety
+        if request.include_context and sources:
+            print(f"Including context as requested (include_context={request.include_context})")
+            # Send context with delimiter
+            context_delimiter = "--- CONTEXT_DELIMITER ---"
+            context_message = json.dumps({
+                "type": "content",
+                "content": f"\n\n{context_delimiter}\n\n{sources['context']}"
             }) + "\n"
-            yield end_message
-            
-            # Check include_context - convert to boolean again for extra safety
-            if request.include_context:
-                print(f"Including context as requested (include_context={request.include_context})")
-                # Send context with delimiter
-                context_delimiter = "--- CONTEXT_DELIMITER ---"
-                context_message = json.dumps({
-                    "type": "content",
-                    "content": f"\n\n{context_delimiter}\n\n{context}"
-                }) + "\n"
-                yield context_message
-            else:
-                print(f"Skipping context as not requested (include_context={request.include_context})")
+            yield context_message
+        else:
+            print(f"Skipping context as not requested (include_context={request.include_context})")
     
-        return StreamingResponse(
-            response_generator(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache, no-transform",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream",
-                "X-Accel-Buffering": "no",  # Disable buffering in Nginx
-                "Transfer-Encoding": "chunked"
-            }
-        )
-    
-    except Exception as e:
-        print(f"Stream error: {e}")
-        raise HTTPException(status_code=500, detail=f"Error streaming query: {str(e)}")
+    return StreamingResponse(
+        response_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache, no-transform",
+            "Connection": "keep-alive",
+            "Content-Type": "text/event-stream",
+            "X-Accel-Buffering": "no",  # Disable buffering in Nginx
+            "Transfer-Encoding": "chunked"
+        }
+    )
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 
 from models.responses import RepositoryListResponse
+from executors import run_search
 
 router = APIRouter()
 
@@ -10,20 +11,8 @@ async def list_repositories():
     List all repositories in the database.
     """
     try:
-        from milvusdb import client
-        collections = client.list_collections()
-        repositories = []
-        
-        for collection in collections:
-            collection_name = collection.name
-            
-            if collection_name.startswith("repo_"):
-                # Extract the repository name from the collection name
-                # The format is: repo_<hash>_<repository_name>
-                parts = collection_name.split("_", 2)
-                if len(parts) >= 3:
-                    repositories.append(parts[2])
-        
+        from milvusdb import list_repository_names
+        repositories = await run_search(list_repository_names)
         return RepositoryListResponse(repositories=repositories)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing repositories: {str(e)}")
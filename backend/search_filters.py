@@ -0,0 +1,147 @@
+import fnmatch
+import os
+
+# Metadata filters for scoped queries ("only under services/", "only classes").
+# A filter is a dict with a vector store `where` clause over chunk metadata,
+# an optional `where_document` clause over chunk text, and optional path
+# globs (any one may match) for what metadata equality cannot express.
+# Paths are matched against the path of each file relative to the ingested
+# workspace, whose leading directories are stored as dir1, dir2, ... so a
+# path prefix is a single equality check.
+
+# Directory levels stored per chunk; deeper prefixes fall back to globs
+PATH_FILTER_DEPTH = 8
+# Extra candidates fetched per wanted hit when a glob is checked after the search
+GLOB_OVERFETCH = 4
+
+LANGUAGES = {
+    ".py": "python",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".tsx": "typescript",
+    ".md": "markdown",
+}
+
+# Short names accepted for chunk types
+CHUNK_TYPES = {
+    "function": "function_definition",
+    "class": "class_definition",
+}
+
+def language_of(file_path):
+    return LANGUAGES.get(os.path.splitext(file_path)[1].lower(), "")
+
+def path_metadata(path):
+    """path, language and dir1..dirN metadata for a workspace-relative path"""
+    path = path.replace(os.sep, "/").lstrip("/")
+    dirs = path.split("/")[:-1]
+    metadata = {"path": path, "language": language_of(path)}
+    for depth in range(1, min(len(dirs), PATH_FILTER_DEPTH) + 1):
+        metadata[f"dir{depth}"] = "/".join(dirs[:depth])
+    return metadata
+
+def _is_glob(part):
+    return any(c in part for c in "*?[")
+
+def _path_conditions(path):
+    """(where conditions, leftover globs) for a path prefix or glob"""
+    path = path.replace(os.sep, "/").strip().strip("/")
+    if not path:
+        return [], ()
+    parts = path.split("/")
+    if not any(_is_glob(p) for p in parts):
+        depth = len(parts)
+        if depth <= PATH_FILTER_DEPTH:
+            # A directory prefix, or the path of one file
+            return [{"$or": [{f"dir{depth}": path}, {"path": path}]}], ()
+        # Too deep for dirN: the file itself, or anything below the prefix
+        return [{"$or": [
+            {"path": path},
+            {f"dir{PATH_FILTER_DEPTH}": "/".join(parts[:PATH_FILTER_DEPTH])},
+        ]}], (path, f"{path}/*")
+    # Push the literal leading directories down, match the rest in Python
+    literal = []
+    for part in parts:
+        if _is_glob(part) or len(literal) == PATH_FILTER_DEPTH:
+            break
+        literal.append(part)
+    conditions = [{f"dir{len(literal)}": "/".join(literal)}] if literal else []
+    return conditions, (path,)
+
+def make_filter(path=None, chunk_type=None, symbol=None, language=None, contains=None):
+    """
+    A search filter from query parameters, or None if nothing is filtered.
+    `symbol` may be qualified ("Class.method"); `language` may be a name or
+    a file extension.
+    """
+    conditions, globs = _path_conditions(path) if path else ([], ())
+    if chunk_type:
+        chunk_type = chunk_type.strip().lower()
+        conditions.append({"type": CHUNK_TYPES.get(chunk_type, chunk_type)})
+    if symbol:
+        parent, _, name = symbol.strip().rpartition(".")
+        conditions.append({"name": name})
+        if parent:
+            conditions.append({"parent": parent})
+    if language:
+        language = language.strip().lower()
+        conditions.append({"language": LANGUAGES.get("." + language.lstrip("."), language)})
+    if not conditions and not globs and not contains:
+        return None
+    where = None
+    if len(conditions) == 1:
+        where = conditions[0]
+    elif conditions:
+        where = {"$and": conditions}
+    return {
+        "where": where,
+        "where_document": {"$contains": contains} if contains else None,
+        "globs": globs,
+    }
+
+def filter_key(search_filter):
+    """A hashable form of a filter, for cache keys"""
+    if search_filter is None:
+        return None
+    return repr(sorted(search_filter.items()))
+
+def _matches_where(metadata, where):
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches_where(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches_where(metadata, c) for c in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, operand in condition.items():
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+    return True
+
+def matches_glob(metadata, search_filter):
+    """The part of a filter a vector store cannot check: the path globs"""
+    globs = search_filter and search_filter.get("globs")
+    path = metadata.get("path") or ""
+    return not globs or any(fnmatch.fnmatchcase(path, glob) for glob in globs)
+
+def matches(metadata, document, search_filter):
+    """Whether a chunk passes the whole filter (for results found another way)"""
+    if search_filter is None:
+        return True
+    if search_filter["where"] and not _matches_where(metadata, search_filter["where"]):
+        return False
+    contains = (search_filter["where_document"] or {}).get("$contains")
+    if contains and contains not in document:
+        return False
+    return matches_glob(metadata, search_filter)
@@ -0,0 +1,75 @@
+import asyncio
+import time
+from typing import Dict, Any, List
+
+from watcher import watch_workspace
+
+# In-memory registry of running workspace watchers, one per repository
+watchers = {}
+
+def _on_update(repository_name: str, paths: List[str], stats: Dict[str, Any]) -> None:
+    watch = watchers.get(repository_name)
+    if watch is None:
+        return
+    watch["updates"] += 1
+    watch["files_updated"] += stats.get("files_changed", 0) + stats.get("files_removed", 0)
+    watch["last_update"] = time.time()
+
+def _on_done(repository_name: str, task: asyncio.Task) -> None:
+    watch = watchers.get(repository_name)
+    if watch is None or watch["task"] is not task:
+        return
+    watch["status"] = "stopped"
+    if not task.cancelled() and task.exception() is not None:
+        watch["status"] = "error"
+        watch["error"] = str(task.exception())
+
+def start_watch(workspace_path: str, repository_name: str) -> Dict[str, Any]:
+    """Start watching a workspace, unless this repository is already watched"""
+    existing = watchers.get(repository_name)
+    if existing and existing["status"] == "watching":
+        return existing
+
+    stop_event = asyncio.Event()
+    task = asyncio.ensure_future(watch_workspace(
+        workspace_path,
+        repository_name,
+        stop_event=stop_event,
+        on_update=lambda paths, stats: _on_update(repository_name, paths, stats),
+    ))
+    watchers[repository_name] = {
+        "status": "watching",
+        "repository": repository_name,
+        "workspace_path": workspace_path,
+        "started_at": time.time(),
+        "updates": 0,
+        "files_updated": 0,
+        "last_update": None,
+        "error": None,
+        "task": task,
+        "stop_event": stop_event,
+    }
+    task.add_done_callback(lambda t: _on_done(repository_name, t))
+    return watchers[repository_name]
+
+async def stop_watch(repository_name: str) -> bool:
+    """Stop a watcher; returns False if the repository was not being watched"""
+    watch = watchers.pop(repository_name, None)
+    if watch is None:
+        return False
+    watch["stop_event"].set()
+    try:
+        await asyncio.wait_for(watch["task"], timeout=10)
+    except asyncio.TimeoutError:
+        # Stuck in an ingest; cancel it, the manifest keeps what was committed
+        watch["task"].cancel()
+    except Exception:
+        pass
+    return True
+
+async def stop_all_watches() -> None:
+    for repository_name in list(watchers):
+        await stop_watch(repository_name)
+
+def list_watches() -> List[Dict[str, Any]]:
+    return list(watchers.values())
@@ -0,0 +1,97 @@
+import asyncio
+
+# Request coalescing for the query path.
+# Identical questions that arrive while one is already being answered share
+# that answer instead of each running embedding, search and generation.
+# SingleFlight shares the result of a coroutine; StreamBroadcast shares an
+# async generator, replaying what was already produced to late subscribers.
+# The upstream work is cancelled only once every caller has gone away.
+
+class SingleFlight:
+    def __init__(self):
+        self.calls = {}
+
+    def _forget(self, key, call):
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+    async def do(self, key, func):
+        """Await func() once per key, however many callers ask at the same time"""
+        call = self.calls.get(key)
+        if call is None:
+            call = {"task": asyncio.ensure_future(func()), "waiters": 0}
+            self.calls[key] = call
+            call["task"].add_done_callback(lambda _: self._forget(key, call))
+        call["waiters"] += 1
+        try:
+            # Shielded: one caller being cancelled must not cancel the others
+            return await asyncio.shield(call["task"])
+        finally:
+            call["waiters"] -= 1
+            if call["waiters"] == 0 and not call["task"].done():
+                call["task"].cancel()
+                self._forget(key, call)
+
+class _Broadcast:
+    def __init__(self, source):
+        self.events = []
+        self.finished = False
+        self.error = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source):
+        try:
+            async for event in source:
+                async with self.changed:
+                    self.events.append(event)
+                    self.changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            async with self.changed:
+                self.finished = True
+                self.changed.notify_all()
+
+class StreamBroadcast:
+    def __init__(self):
+        self.streams = {}
+
+    def _forget(self, key, stream):
+        if self.streams.get(key) is stream:
+            del self.streams[key]
+
+    async def subscribe(self, key, func):
+        """
+        Yield the events of func() (an async generator), started once per key.
+        A subscriber that joins late first gets every event produced so far.
+        """
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = _Broadcast(func())
+            self.streams[key] = stream
+            stream.task.add_done_callback(lambda _: self._forget(key, stream))
+        stream.subscribers += 1
+        sent = 0
+        try:
+            while True:
+                async with stream.changed:
+                    await stream.changed.wait_for(
+                        lambda: len(stream.events) > sent or stream.finished
+                    )
+                    events = stream.events[sent:]
+                    finished = stream.finished
+                sent += len(events)
+                for event in events:
+                    yield event
+                if finished and sent == len(stream.events):
+                    if stream.error is not None:
+                        raise stream.error
+                    return
+        finally:
+            stream.subscribers -= 1
+            if stream.subscribers == 0 and not stream.task.done():
+                # Last subscriber gone: stop generating for nobody
+                stream.task.cancel()
+                self._forget(key, stream)
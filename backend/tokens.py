@@ -0,0 +1,9 @@
+import re
+
+# Cheap, dependency-free token estimate for code and prose.
+# Counts identifiers/numbers and individual punctuation marks, which tracks
+# BPE token counts for source code closely enough for budgeting chunks.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text):
+    return len(_TOKEN_RE.findall(text))
@@ -0,0 +1,13 @@
+# Vector store backends
+from config import VECTOR_STORE
+from vectorstores.base import VectorStore
+
+def create_vector_store(data_dir, backend=VECTOR_STORE):
+    """The configured VectorStore, keeping its data under data_dir"""
+    if backend == "chroma":
+        from vectorstores.chroma import ChromaStore
+        return ChromaStore(data_dir)
+    if backend == "mmap":
+        from vectorstores.mmap_store import MmapStore
+        return MmapStore(data_dir)
+    raise ValueError(f"Unknown VECTOR_STORE: {backend} (expected 'chroma' or 'mmap')")
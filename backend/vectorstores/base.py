@@ -0,0 +1,79 @@
+import numpy as np
+
+# The interface every vector store backend implements.
+# A store holds named collections (one per repository) of chunks: an id, an
+# embedding, a metadata dict and the chunk text. Distances are squared L2,
+# smaller is closer, so hits from different backends compare the same way.
+# Writes create a collection on first use; reads and deletes never do, and
+# treat a missing collection as empty.
+
+def fit_dimension(vectors, dim):
+    """
+    Matryoshka truncation: the first `dim` components of each row, rescaled to
+    unit length. Rows that are already `dim` long are returned as they are.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.shape[1] == dim:
+        return vectors
+    if vectors.shape[1] < dim:
+        raise ValueError(f"Expected {dim}-dimensional embeddings, got {vectors.shape[1]}")
+    truncated = vectors[:, :dim]
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return truncated / norms
+
+class VectorStore:
+    name = ""
+    # Most rows one write call accepts; None if there is no limit
+    max_batch_size = None
+
+    def insert(self, collection, ids, embeddings, metadatas, documents):
+        """Add new chunks"""
+        self.upsert(collection, ids, embeddings, metadatas, documents)
+
+    def upsert(self, collection, ids, embeddings, metadatas, documents):
+        """Add chunks, replacing any with the same id"""
+        raise NotImplementedError
+
+    def delete(self, collection, ids):
+        """Remove chunks by id"""
+        raise NotImplementedError
+
+    def delete_files(self, collection, file_paths):
+        """Remove every chunk whose "file" metadata is one of file_paths"""
+        raise NotImplementedError
+
+    def search(self, collection, query_embeddings, top_k, where=None, where_document=None):
+        """
+        The top_k nearest chunks for each query embedding, as lists of
+        (id, metadata, document, distance), nearest first. `where` (over
+        metadata: $eq, $ne, $in, $nin, $and, $or) and `where_document`
+        ($contains) restrict the search as in Chroma.
+        """
+        raise NotImplementedError
+
+    def get(self, collection, ids):
+        """[(id, metadata, document)] for the ids that exist, in no particular order"""
+        raise NotImplementedError
+
+    def count(self, collection):
+        raise NotImplementedError
+
+    def list_collections(self):
+        """Names of every collection in the store"""
+        raise NotImplementedError
+
+    def collection_metadata(self, collection):
+        """Metadata recorded with set_collection_metadata, or None if there is no such collection"""
+        raise NotImplementedError
+
+    def set_collection_metadata(self, collection, metadata):
+        """Merge string values into a collection's metadata, creating the collection if needed"""
+        raise NotImplementedError
+
+    def stats(self, collection):
+        """Size and layout of a collection, for diagnostics and benchmarks"""
+        return {"backend": self.name, "count": self.count(collection)}
+
+    def close(self):
+        """Flush anything still held in memory"""
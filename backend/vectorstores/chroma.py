@@ -0,0 +1,99 @@
+import chromadb
+
+from config import EMBEDDING_TRUNCATE_DIM
+from vectorstores.base import VectorStore, fit_dimension
+
+# VectorStore over an embedded ChromaDB PersistentClient (the default backend).
+# Chroma stores float32 vectors only; a collection created with
+# EMBEDDING_TRUNCATE_DIM set records it and keeps only that many dimensions.
+
+class ChromaStore(VectorStore):
+    name = "chroma"
+
+    def __init__(self, path, truncate_dim=EMBEDDING_TRUNCATE_DIM):
+        self.client = chromadb.PersistentClient(path=path)
+        self.max_batch_size = getattr(self.client, "max_batch_size", None)
+        self.truncate_dim = truncate_dim
+
+    def collection(self, name, create=True):
+        """Get a collection, creating it unless create=False (then None if it does not exist)"""
+        try:
+            return self.client.get_collection(name=name)
+        except Exception:
+            if not create:
+                return None
+            metadata = {"truncate_dim": self.truncate_dim} if self.truncate_dim else None
+            collection = self.client.create_collection(name=name, metadata=metadata)
+            print(f"Created new collection: {name}")
+            return collection
+
+    @staticmethod
+    def _fit(collection, embeddings):
+        dim = (collection.metadata or {}).get("truncate_dim")
+        if not dim:
+            return embeddings
+        return fit_dimension(embeddings, min(dim, len(embeddings[0]))).tolist()
+
+    def insert(self, collection, ids, embeddings, metadatas, documents):
+        collection = self.collection(collection)
+        collection.add(
+            ids=ids, embeddings=self._fit(collection, embeddings), metadatas=metadatas, documents=documents
+        )
+
+    def upsert(self, collection, ids, embeddings, metadatas, documents):
+        collection = self.collection(collection)
+        collection.upsert(
+            ids=ids, embeddings=self._fit(collection, embeddings), metadatas=metadatas, documents=documents
+        )
+
+    def delete(self, collection, ids):
+        collection = self.collection(collection, create=False)
+        if ids and collection is not None:
+            collection.delete(ids=list(ids))
+
+    def delete_files(self, collection, file_paths):
+        collection = self.collection(collection, create=False)
+        if file_paths and collection is not None:
+            collection.delete(where={"file": {"$in": list(file_paths)}})
+
+    def search(self, collection, query_embeddings, top_k, where=None, where_document=None):
+        collection = self.collection(collection, create=False)
+        if collection is None:
+            return [[] for _ in query_embeddings]
+        results = collection.query(
+            query_embeddings=self._fit(collection, list(query_embeddings)),
+            n_results=top_k,
+            where=where,
+            where_document=where_document,
+            include=["metadatas", "documents", "distances"]
+        )
+        return [
+            list(zip(ids, metas, documents, distances))
+            for ids, metas, documents, distances in zip(
+                results["ids"], results["metadatas"], results["documents"], results["distances"]
+            )
+        ]
+
+    def get(self, collection, ids):
+        collection = self.collection(collection, create=False)
+        if collection is None:
+            return []
+        results = collection.get(ids=list(ids), include=["metadatas", "documents"])
+        return list(zip(results["ids"], results["metadatas"], results["documents"]))
+
+    def count(self, collection):
+        collection = self.collection(collection, create=False)
+        return collection.count() if collection is not None else 0
+
+    def list_collections(self):
+        return [c.name for c in self.client.list_collections()]
+
+    def collection_metadata(self, collection):
+        collection = self.collection(collection, create=False)
+        return dict(collection.metadata or {}) if collection is not None else None
+
+    def set_collection_metadata(self, collection, metadata):
+        collection = self.collection(collection)
+        merged = {**(collection.metadata or {}), **metadata}
+        if merged != collection.metadata:
+            collection.modify(metadata=merged)
@@ -0,0 +1,686 @@
+import atexit
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import hnswlib
+import numpy as np
+
+from config import (
+    MMAP_EXACT_SEARCH_LIMIT,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    MMAP_INDEX_SAVE_INTERVAL,
+    VECTOR_PRECISION,
+    EMBEDDING_TRUNCATE_DIM,
+    VECTOR_RESCORE_FACTOR,
+)
+from search_filters import PATH_FILTER_DEPTH
+from vectorstores.base import VectorStore, fit_dimension
+
+# In-process VectorStore: each collection is a directory holding
+#   vectors.<precision>  a memory-mapped matrix, one row ("slot") per chunk
+#   scales.f32           per-row scale factors (int8 collections only)
+#   full.f32             full-precision vectors for re-scoring (optional)
+#   rows.sqlite3         the id, metadata and text of each live slot, with the
+#                        fields queries filter on in (mostly indexed) columns
+#   index.hnsw           an HNSW graph over the slots, once the collection is large
+# Vectors can be truncated to their first dimensions (Matryoshka) and stored
+# as fp32, fp16 or int8; a collection keeps the settings it was created with.
+# Small collections are searched exactly, a block of rows at a time; above
+# MMAP_EXACT_SEARCH_LIMIT chunks an HNSW index answers instead. When a
+# full-precision copy is kept, the top candidates are re-scored with it.
+# Searches run concurrently with each other; writes wait for them and run
+# alone. Slots of deleted chunks are reused by later inserts. The index is
+# saved at most every MMAP_INDEX_SAVE_INTERVAL seconds and at exit; an index
+# older than the rows (e.g. after a crash) is rebuilt from the vectors.
+
+MIN_CAPACITY = 1024
+# Rows decoded at once by exact search
+SCAN_BLOCK_ROWS = 16384
+PRECISIONS = {"fp32": np.float32, "fp16": np.float16, "int8": np.int8}
+
+_FIELD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_COMPARISONS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+# Metadata fields copied into columns of rows, so search filters
+# (search_filters.make_filter) compare columns instead of parsing JSON;
+# other fields are read from the JSON metadata
+FILTER_FIELDS = ("path", "language", "type", "name", "parent") + tuple(
+    f"dir{depth}" for depth in range(1, PATH_FILTER_DEPTH + 1)
+)
+# Too few distinct values to be worth an index: SQLite would pick one over a
+# selective path or name lookup
+UNINDEXED_FIELDS = ("language", "type")
+_ROW_COLUMNS = ("slot", "id", "file", "metadata", "document") + FILTER_FIELDS
+
+def where_sql(where):
+    """A Chroma-style metadata `where` clause as SQL over rows: (sql, params)"""
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_sql(c) for c in condition]
+            clauses.append("(" + f" {key[1:].upper()} ".join(sql for sql, _ in parts) + ")")
+            params.extend(p for _, part_params in parts for p in part_params)
+            continue
+        if not _FIELD.fullmatch(key):
+            raise ValueError(f"Invalid metadata field in filter: {key}")
+        column = key if key in FILTER_FIELDS else f"json_extract(metadata, '$.{key}')"
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, operand in condition.items():
+            if op in ("$in", "$nin"):
+                negate = "NOT " if op == "$nin" else ""
+                clauses.append(f"{column} {negate}IN ({','.join('?' * len(operand))})")
+                params.extend(operand)
+            elif op in _COMPARISONS:
+                clauses.append(f"{column} {_COMPARISONS[op]} ?")
+                params.append(operand)
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+    return " AND ".join(clauses) or "1", params
+
+class _ReadWriteLock:
+    """Any number of readers or one writer; a waiting writer holds off new readers"""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writing or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+class _Matrix:
+    """A (capacity, width) array memory-mapped from one file, grown on demand"""
+    def __init__(self, path, dtype, width):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.array = None
+        self.capacity = 0
+
+    def rows_on_disk(self):
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // (self.width * self.dtype.itemsize)
+
+    def resize(self, capacity):
+        if self.array is not None:
+            self.array.flush()
+            self.array = None
+        size = capacity * self.width * self.dtype.itemsize
+        with open(self.path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self.array = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(capacity, self.width))
+        self.capacity = capacity
+
+    def flush(self):
+        if self.array is not None:
+            self.array.flush()
+
+    def disk_bytes(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+class _Collection:
+    def __init__(self, directory, precision, truncate_dim, rescore_factor):
+        """precision/truncate_dim/rescore_factor apply only if the collection is new"""
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown VECTOR_PRECISION: {precision} (expected fp32, fp16 or int8)")
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.hnsw")
+        self.lock = _ReadWriteLock()
+        # Searches share the read lock, so building the index needs its own
+        self._index_lock = threading.Lock()
+        self._local = threading.local()
+        self.rescore_factor = rescore_factor
+        self.truncate_dim = truncate_dim
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " slot INTEGER PRIMARY KEY,"
+            " id TEXT NOT NULL UNIQUE,"
+            " file TEXT NOT NULL,"
+            " metadata TEXT NOT NULL,"
+            " document TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS rows_file ON rows (file);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        )
+        self._add_filter_columns(conn)
+        conn.commit()
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        self.precision = meta.get("precision", precision)
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.full_dim = int(meta.get("full_dim", 0))
+        self.generation = int(meta.get("generation", 0))
+        slots = np.array([row[0] for row in conn.execute("SELECT slot FROM rows")], dtype=np.int64)
+        self.size = int(slots.max()) + 1 if len(slots) else 0
+        self.capacity = 0
+        self.vectors = self.scales = self.full = None
+        self.live = np.zeros(0, dtype=bool)
+        self.sq_norms = np.zeros(0, dtype=np.float32)
+        self.index = None
+        self.index_dirty = False
+        self.last_index_save = time.monotonic()
+        if self.dim is not None:
+            self._open_matrices()
+            self._grow(max(self.size, self.vectors.rows_on_disk(), MIN_CAPACITY))
+            self.live[slots] = True
+            for start in range(0, self.size, SCAN_BLOCK_ROWS):
+                block = self._decode(start, min(start + SCAN_BLOCK_ROWS, self.size))
+                self.sq_norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+        self.free = [int(s) for s in np.flatnonzero(~self.live[:self.size])]
+
+    def _add_filter_columns(self, conn):
+        """Create the FILTER_FIELDS columns, filling them in for rows stored without them"""
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(rows)")}
+        for field in FILTER_FIELDS:
+            if field not in existing:
+                conn.execute(f"ALTER TABLE rows ADD COLUMN {field} TEXT")
+                conn.execute(f"UPDATE rows SET {field} = json_extract(metadata, '$.{field}')")
+            if field not in UNINDEXED_FIELDS:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS rows_{field} ON rows ({field})")
+
+    def _connection(self):
+        """One connection per thread, as in EmbeddingCache"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, "rows.sqlite3"), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    ## Vector files
+    def _create(self, conn, full_dim):
+        """Fix the layout of a new collection from its first vectors"""
+        self.dim = self.truncate_dim if 0 < self.truncate_dim < full_dim else full_dim
+        # The full vectors are only worth keeping if the stored ones lost something
+        lossy = self.precision != "fp32" or self.dim < full_dim
+        self.full_dim = full_dim if lossy and self.rescore_factor > 0 else 0
+        conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+            ("dim", str(self.dim)), ("full_dim", str(self.full_dim)), ("precision", self.precision),
+        ])
+        self._open_matrices()
+        self._grow(MIN_CAPACITY)
+
+    def _open_matrices(self):
+        dtype = PRECISIONS[self.precision]
+        self.vectors = _Matrix(os.path.join(self.directory, f"vectors.{self.precision}"), dtype, self.dim)
+        if self.precision == "int8":
+            self.scales = _Matrix(os.path.join(self.directory, "scales.f32"), np.float32, 1)
+        if self.full_dim:
+            self.full = _Matrix(os.path.join(self.directory, "full.f32"), np.float32, self.full_dim)
+
+    def _matrices(self):
+        return [m for m in (self.vectors, self.scales, self.full) if m is not None]
+
+    def _grow(self, capacity):
+        for matrix in self._matrices():
+            matrix.resize(capacity)
+        self.live = np.concatenate([self.live, np.zeros(capacity - len(self.live), dtype=bool)])
+        self.sq_norms = np.concatenate([self.sq_norms, np.zeros(capacity - len(self.sq_norms), dtype=np.float32)])
+        self.capacity = capacity
+        if self.index is not None:
+            self.index.resize_index(capacity)
+
+    def _encode(self, vectors):
+        """Stored form of float32 vectors: (rows, int8 scales or None)"""
+        if self.precision == "int8":
+            # Symmetric per-row quantization: the largest component maps to 127
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(PRECISIONS[self.precision]), None
+
+    def _decode(self, start, end=None):
+        """Stored vectors back as float32, for slots[start:end] or an array of slots"""
+        index = slice(start, end) if end is not None else start
+        vectors = np.asarray(self.vectors.array[index], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales.array[index]
+        return vectors
+
+    def _allocate(self, count):
+        """Slots for `count` new rows, reusing free ones first"""
+        reused = [self.free.pop() for _ in range(min(count, len(self.free)))]
+        fresh = list(range(self.size, self.size + count - len(reused)))
+        self.size += len(fresh)
+        if self.size > self.capacity:
+            self._grow(max(self.size, self.capacity * 2, MIN_CAPACITY))
+        return reused + fresh
+
+    def _select_in(self, conn, query, values):
+        """Run `query` (with one "IN ({})" placeholder list) over values, 500 at a time"""
+        values = list(values)
+        rows = []
+        for i in range(0, len(values), 500):
+            part = values[i:i + 500]
+            rows.extend(conn.execute(query.format(",".join("?" * len(part))), part))
+        return rows
+
+    def _slots_by_id(self, conn, ids):
+        return dict(self._select_in(conn, "SELECT id, slot FROM rows WHERE id IN ({})", ids))
+
+    ## Writes
+    def upsert(self, ids, embeddings, metadatas, documents):
+        # The last copy of an id in one call wins
+        latest = {cid: i for i, cid in enumerate(ids)}
+        order = sorted(latest.values())
+        vectors = np.asarray(embeddings, dtype=np.float32)[order]
+        with self.lock.write():
+            conn = self._connection()
+            if self.dim is None:
+                self._create(conn, vectors.shape[1])
+            if self.full_dim and vectors.shape[1] != self.full_dim:
+                raise ValueError(f"Expected {self.full_dim}-dimensional embeddings, got {vectors.shape[1]}")
+            compact = fit_dimension(vectors, self.dim)
+            stored, scales = self._encode(compact)
+            existing = self._slots_by_id(conn, [ids[i] for i in order])
+            new = [ids[i] for i in order if ids[i] not in existing]
+            existing.update(zip(new, self._allocate(len(new))))
+            slots = np.array([existing[ids[i]] for i in order], dtype=np.int64)
+            self.vectors.array[slots] = stored
+            if self.scales is not None:
+                self.scales.array[slots, 0] = scales
+            if self.full is not None:
+                self.full.array[slots] = vectors
+            # Searches see the stored (possibly lossy) vectors, so norms come from those
+            searched = self._decode(slots)
+            self.live[slots] = True
+            self.sq_norms[slots] = np.einsum("ij,ij->i", searched, searched)
+            self.generation += 1
+            with conn:
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO rows ({', '.join(_ROW_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(_ROW_COLUMNS))})",
+                    [
+                        (int(slot), ids[i], metadatas[i].get("file") or "", json.dumps(metadatas[i]), documents[i],
+                         *(metadatas[i].get(field) for field in FILTER_FIELDS))
+                        for slot, i in zip(slots, order)
+                    ]
+                )
+                self._save_generation(conn)
+            if self.index is not None:
+                # Re-adding a label replaces its vector and undoes a deletion
+                self.index.add_items(searched, slots)
+                self.index_dirty = True
+            self._maybe_save_index()
+
+    def _delete_slots(self, slots):
+        slots = [int(s) for s in slots]
+        if not slots:
+            return
+        conn = self._connection()
+        self.live[slots] = False
+        self.free.extend(slots)
+        self.generation += 1
+        with conn:
+            self._select_in(conn, "DELETE FROM rows WHERE slot IN ({})", slots)
+            self._save_generation(conn)
+        if self.index is not None:
+            for slot in slots:
+                self.index.mark_deleted(slot)
+            self.index_dirty = True
+        self._maybe_save_index()
+
+    def delete(self, ids):
+        with self.lock.write():
+            self._delete_slots(self._slots_by_id(self._connection(), ids).values())
+
+    def delete_files(self, file_paths):
+        with self.lock.write():
+            rows = self._select_in(self._connection(), "SELECT slot FROM rows WHERE file IN ({})", file_paths)
+            self._delete_slots(slot for (slot,) in rows)
+
+    def _save_generation(self, conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (str(self.generation),)
+        )
+
+    ## HNSW index
+    def _hnsw(self):
+        """The HNSW index over every live slot, loaded or built on first use"""
+        if self.index is not None:
+            return self.index
+        with self._index_lock:
+            if self.index is None:
+                self.index = self._load_or_build_index()
+        return self.index
+
+    def _load_or_build_index(self):
+        index = hnswlib.Index(space="l2", dim=self.dim)
+        meta = dict(self._connection().execute("SELECT key, value FROM meta"))
+        if os.path.exists(self.index_path) and int(meta.get("index_generation", -1)) == self.generation:
+            index.load_index(self.index_path, max_elements=self.capacity)
+        else:
+            start = time.perf_counter()
+            index.init_index(max_elements=self.capacity, ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+            slots = np.flatnonzero(self.live[:self.size])
+            for i in range(0, len(slots), 10000):
+                part = slots[i:i + 10000]
+                index.add_items(self._decode(part), part)
+            print(f"Built HNSW index over {len(slots)} vectors in {time.perf_counter() - start:.1f}s")
+            self.index_dirty = True
+        return index
+
+    def _maybe_save_index(self, force=False):
+        if self.index is None or not self.index_dirty:
+            return
+        if not force and time.monotonic() - self.last_index_save < MMAP_INDEX_SAVE_INTERVAL:
+            return
+        for matrix in self._matrices():
+            matrix.flush()
+        self.index.save_index(self.index_path)
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('index_generation', ?)",
+                (str(self.generation),)
+            )
+        self.index_dirty = False
+        self.last_index_save = time.monotonic()
+
+    def close(self):
+        with self.lock.write():
+            for matrix in self._matrices():
+                matrix.flush()
+            self._maybe_save_index(force=True)
+
+    def set_metadata(self, metadata):
+        with self.lock.write():
+            merged = {**self.metadata(), **metadata}
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('metadata', ?)", (json.dumps(merged),)
+                )
+
+    ## Reads
+    def metadata(self):
+        row = self._connection().execute("SELECT value FROM meta WHERE key = 'metadata'").fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def count(self):
+        return int(self.live[:self.size].sum())
+
+    def uses_index(self):
+        return self.count() > MMAP_EXACT_SEARCH_LIMIT
+
+    def search(self, query_embeddings, top_k, exact=None, rescore=None, where=None, where_document=None):
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        with self.lock.read():
+            allowed = None
+            if where or where_document:
+                allowed = self._filter_slots(where, where_document)
+                live = len(allowed)
+            else:
+                live = self.count()
+            k = min(top_k, live)
+            if k == 0:
+                return [[] for _ in range(len(queries))]
+            if exact is None:
+                # A filter that leaves few enough chunks is scanned exactly
+                exact = live <= MMAP_EXACT_SEARCH_LIMIT
+            if rescore is None:
+                rescore = self.rescore_factor
+            rescore = rescore if self.full is not None and queries.shape[1] == self.full_dim else 0
+            candidates = min(k * rescore, live) if rescore else k
+            compact = fit_dimension(queries, self.dim)
+            if exact:
+                slots, distances = self._exact_search(compact, candidates, allowed)
+            else:
+                index = self._hnsw()
+                # ef is shared by concurrent searches; hnswlib never goes below k
+                index.set_ef(max(HNSW_EF_SEARCH, candidates))
+                mask = None
+                if allowed is not None:
+                    mask = np.zeros(self.capacity, dtype=bool)
+                    mask[allowed] = True
+                slots, distances = index.knn_query(
+                    compact, k=candidates, filter=None if mask is None else mask.__getitem__
+                )
+            if rescore:
+                slots, distances = self._rescore(queries, slots, k)
+            rows = self._rows_by_slot(set(slots.ravel().tolist()))
+        return [
+            [(*rows[int(slot)], float(distance)) for slot, distance in zip(slot_row, distance_row)]
+            for slot_row, distance_row in zip(slots, distances)
+        ]
+
+    def _filter_slots(self, where, where_document):
+        """Sorted slots of the chunks matching a where/where_document filter"""
+        sql, params = where_sql(where) if where else ("1", [])
+        contains = (where_document or {}).get("$contains")
+        if contains is not None:
+            sql += " AND instr(document, ?) > 0"
+            params.append(contains)
+        rows = self._connection().execute(f"SELECT slot FROM rows WHERE {sql} ORDER BY slot", params)
+        return np.array([slot for (slot,) in rows], dtype=np.int64)
+
+    def _blocks(self, slots):
+        """(slots, float32 vectors, live mask or None) a block at a time"""
+        if slots is None:
+            for start in range(0, self.size, SCAN_BLOCK_ROWS):
+                end = min(start + SCAN_BLOCK_ROWS, self.size)
+                yield np.arange(start, end), self._decode(start, end), self.live[start:end]
+        else:
+            for i in range(0, len(slots), SCAN_BLOCK_ROWS):
+                part = slots[i:i + SCAN_BLOCK_ROWS]
+                yield part, self._decode(part), None
+
+    def _exact_search(self, queries, k, slots=None):
+        """Brute force squared L2 distances to every live slot, or to `slots`"""
+        query_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+        best_slots = np.zeros((len(queries), 0), dtype=np.int64)
+        best = np.zeros((len(queries), 0), dtype=np.float32)
+        for block_slots, vectors, live in self._blocks(slots):
+            distances = query_norms - 2 * queries @ vectors.T + self.sq_norms[block_slots]
+            if live is not None:
+                distances[:, ~live] = np.inf
+            # Keep the k best seen so far
+            block_slots = np.concatenate([best_slots, np.broadcast_to(block_slots, distances.shape)], axis=1)
+            distances = np.concatenate([best, distances], axis=1)
+            keep = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            best_slots = np.take_along_axis(block_slots, keep, axis=1)
+            best = np.take_along_axis(distances, keep, axis=1)
+        order = np.argsort(best, axis=1)
+        return np.take_along_axis(best_slots, order, axis=1), np.maximum(np.take_along_axis(best, order, axis=1), 0)
+
+    def _rescore(self, queries, candidates, k):
+        """Re-rank candidate slots by distance to their full-precision vectors"""
+        slots, distances = [], []
+        for query, row in zip(queries, candidates):
+            full = self.full.array[np.sort(row)]
+            exact = np.einsum("ij,ij->i", full - query, full - query)
+            order = np.argsort(exact)[:k]
+            slots.append(np.sort(row)[order])
+            distances.append(exact[order])
+        return np.array(slots), np.array(distances)
+
+    def _rows_by_slot(self, slots):
+        rows = self._select_in(
+            self._connection(), "SELECT slot, id, metadata, document FROM rows WHERE slot IN ({})",
+            [int(s) for s in slots]
+        )
+        return {slot: (cid, json.loads(metadata), document) for slot, cid, metadata, document in rows}
+
+    def get(self, ids):
+        rows = self._select_in(
+            self._connection(), "SELECT id, metadata, document FROM rows WHERE id IN ({})", ids
+        )
+        return [(cid, json.loads(metadata), document) for cid, metadata, document in rows]
+
+    def stats(self):
+        with self.lock.read():
+            dim = self.dim or 0
+            searched_bytes = dim * np.dtype(PRECISIONS[self.precision]).itemsize
+            if self.precision == "int8":
+                searched_bytes += 4
+            files = [m.path for m in self._matrices()]
+            files += [self.index_path, os.path.join(self.directory, "rows.sqlite3")]
+            return {
+                "count": self.count(),
+                "dim": self.dim,
+                "precision": self.precision,
+                "rescore_dim": self.full_dim or None,
+                "capacity": self.capacity,
+                "free_slots": len(self.free),
+                "search": "hnsw" if self.uses_index() else "exact",
+                # Bytes per chunk of the vectors that searches scan, and of all vector files
+                "vector_bytes_per_chunk": searched_bytes,
+                "stored_bytes_per_chunk": searched_bytes + self.full_dim * 4,
+                "disk_bytes": sum(os.path.getsize(p) for p in files if os.path.exists(p)),
+            }
+
+class MmapStore(VectorStore):
+    name = "mmap"
+
+    def __init__(self, data_dir, precision=VECTOR_PRECISION, truncate_dim=EMBEDDING_TRUNCATE_DIM,
+                 rescore_factor=VECTOR_RESCORE_FACTOR):
+        self.root = os.path.join(data_dir, "mmap")
+        self.precision = precision
+        self.truncate_dim = truncate_dim
+        self.rescore_factor = rescore_factor
+        self.collections = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        atexit.register(self.close)
+
+    def collection(self, name, create=True):
+        """Open a collection, creating it unless create=False (then None if it does not exist)"""
+        with self._lock:
+            collection = self.collections.get(name)
+            if collection is None:
+                if not create and not os.path.exists(os.path.join(self.root, name, "rows.sqlite3")):
+                    return None
+                collection = _Collection(
+                    os.path.join(self.root, name), self.precision, self.truncate_dim, self.rescore_factor
+                )
+                self.collections[name] = collection
+            return collection
+
+    def upsert(self, collection, ids, embeddings, metadatas, documents):
+        self.collection(collection).upsert(ids, embeddings, metadatas, documents)
+
+    def delete(self, collection, ids):
+        collection = self.collection(collection, create=False)
+        if collection is not None:
+            collection.delete(ids)
+
+    def delete_files(self, collection, file_paths):
+        collection = self.collection(collection, create=False)
+        if collection is not None:
+            collection.delete_files(file_paths)
+
+    def search(self, collection, query_embeddings, top_k, where=None, where_document=None,
+               exact=None, rescore=None):
+        """
+        `exact` forces brute force (True) or the HNSW index (False); None picks
+        by the number of chunks searched. `rescore` overrides
+        VECTOR_RESCORE_FACTOR (0 disables it).
+        """
+        collection = self.collection(collection, create=False)
+        if collection is None:
+            return [[] for _ in query_embeddings]
+        return collection.search(query_embeddings, top_k, exact, rescore, where, where_document)
+
+    def get(self, collection, ids):
+        collection = self.collection(collection, create=False)
+        return collection.get(ids) if collection is not None else []
+
+    def count(self, collection):
+        collection = self.collection(collection, create=False)
+        return collection.count() if collection is not None else 0
+
+    def list_collections(self):
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, "rows.sqlite3"))
+        )
+
+    def collection_metadata(self, collection):
+        collection = self.collection(collection, create=False)
+        return collection.metadata() if collection is not None else None
+
+    def set_collection_metadata(self, collection, metadata):
+        self.collection(collection).set_metadata(metadata)
+
+    def stats(self, collection):
+        collection = self.collection(collection, create=False)
+        if collection is None:
+            return {"backend": self.name, "count": 0}
+        return {"backend": self.name, **collection.stats()}
+
+    def close(self):
+        with self._lock:
+            collections = list(self.collections.values())
+        for collection in collections:
+            collection.close()
+
+def measure_recall(store, collection, query_embeddings, top_k=10, reference=None, **options):
+    """
+    Recall@top_k of store.search(collection, ..., **options) against exact,
+    un-rescored search of `reference`, a (store, collection) pair holding the
+    same chunks. Without one the collection is its own reference, which only
+    measures the index; a quantized or truncated collection needs an fp32
+    reference to measure what was lost. Also returns the mean latency per
+    query of both, in milliseconds.
+    """
+    if reference is None:
+        stats = store.stats(collection)
+        if stats.get("precision", "fp32") != "fp32" or len(query_embeddings[0]) > (stats.get("dim") or 0):
+            raise ValueError(f"{collection} is quantized or truncated; pass an fp32 reference collection")
+    reference_store, reference_collection = reference or (store, collection)
+    # Load or build any index outside the timed runs
+    store.search(collection, query_embeddings[:1], top_k, **options)
+    runs = {}
+    for name, search in (
+        ("search", lambda q: store.search(collection, [q], top_k, **options)[0]),
+        ("reference", lambda q: reference_store.search(reference_collection, [q], top_k, exact=True, rescore=0)[0]),
+    ):
+        start = time.perf_counter()
+        runs[name] = [search(q) for q in query_embeddings]
+        runs[f"{name}_ms"] = (time.perf_counter() - start) * 1000 / len(query_embeddings)
+    found = sum(
+        len({hit[0] for hit in got} & {hit[0] for hit in expected})
+        for got, expected in zip(runs["search"], runs["reference"])
+    )
+    expected = sum(len(hits) for hits in runs["reference"])
+    return {
+        "recall": found / expected if expected else 1.0,
+        "search_ms": runs["search_ms"],
+        "reference_ms": runs["reference_ms"],
+    }
@@ -0,0 +1,57 @@
+import os
+from watchfiles import awatch, DefaultFilter
+
+from chunker import is_chunkable
+from config import WATCH_DEBOUNCE_MS, WATCH_STEP_MS, WATCH_FORCE_POLLING
+from pipeline import run_ingest_pipeline
+
+# Keeps a repository's collection in sync with a workspace as files change.
+# watchfiles uses inotify/FSEvents/ReadDirectoryChangesW where available
+# (or polling with WATCH_FORCE_POLLING), and groups a burst of saves into
+# one set of changes. Only the touched files are re-chunked and re-embedded.
+
+class ChunkableFilter(DefaultFilter):
+    """
+    watchfiles' default ignores (.git, node_modules, ...) plus our own file
+    types. Ignore files and the scanner's other rules are applied to the
+    changed paths by the pipeline (workspace.PathFilter).
+    """
+    def __call__(self, change, path):
+        return super().__call__(change, path) and is_chunkable(path)
+
+async def watch_workspace(workspace_dir, repo_name=None, stop_event=None,
+                          on_update=None, catch_up=True):
+    """
+    Watch a workspace until `stop_event` is set, ingesting changed files.
+    With catch_up=True an incremental ingest runs first, so edits made while
+    nothing was watching are picked up too. `on_update(paths, stats)` is
+    called after each batch of changes has been applied.
+    """
+    workspace_dir = os.path.abspath(workspace_dir)
+    if repo_name is None:
+        repo_name = os.path.basename(workspace_dir)
+
+    if catch_up:
+        stats = await run_ingest_pipeline(workspace_dir, repo_name)
+        if on_update is not None:
+            on_update([], stats)
+
+    print(f"Watching {workspace_dir} for changes (repository: {repo_name})")
+    async for changes in awatch(
+        workspace_dir,
+        watch_filter=ChunkableFilter(),
+        debounce=WATCH_DEBOUNCE_MS,
+        step=WATCH_STEP_MS,
+        stop_event=stop_event,
+        force_polling=WATCH_FORCE_POLLING or None,
+    ):
+        paths = sorted({path for _, path in changes})
+        print(f"Detected changes in {len(paths)} files")
+        try:
+            stats = await run_ingest_pipeline(workspace_dir, repo_name, paths=paths)
+        except Exception as e:
+            # Keep watching; the manifest still marks these files as stale
+            print(f"Error updating index for {len(paths)} files: {e}")
+            continue
+        if on_update is not None:
+            on_update(paths, stats)
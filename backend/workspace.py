@@ -1,10 +1,307 @@
 import os
+import queue
+import re
+import threading
 
-def scan_workspace(root_dir, exts=('py', 'js', 'ts', 'md')):
-    for root, _, files in os.walk(root_dir):
-        for file in files:
-            if file.split('.')[-1] in exts:
-                yield os.path.join(root, file)
+from config import SCAN_MAX_FILE_BYTES, PROJECT_IGNORE_FILE
+
+# Workspace scanner.
+# Walks with os.scandir, prunes dependency/build/VCS directories and
+# virtualenvs before descending into them, and honours .gitignore files and
+# a project ignore file (same syntax) at every level. Candidate files are
+# skipped if they are too large, binary or minified.
+IGNORED_DIRS = {
+    ".git", ".hg", ".svn", "node_modules", "bower_components", "__pycache__",
+    ".venv", "venv", ".tox", ".nox", ".mypy_cache", ".pytest_cache",
+    ".ruff_cache", ".eggs", "site-packages", "build", "dist", "vendor",
+    "third_party", ".idea", ".vscode", ".next", ".cache",
+}
+IGNORE_FILES = (".gitignore", PROJECT_IGNORE_FILE)
+SCAN_EXTENSIONS = ('py', 'js', 'ts', 'md')
+SNIFF_BYTES = 8192
+
+def _glob_to_regex(pattern):
+    """Translate one gitignore glob (without leading ! or trailing /) to a regex"""
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("(?:/.*)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+class IgnoreRules:
+    """The patterns of one ignore file, matched relative to its directory"""
+    def __init__(self, base_dir, lines):
+        self.base_dir = base_dir
+        self.rules = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            elif line.startswith("\\"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            line = line.lstrip("/")
+            regex = _glob_to_regex(line)
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            try:
+                compiled = re.compile(f"^{regex}$")
+            except re.error:
+                # git ignores patterns it cannot parse (e.g. "[b-a]"); so do we
+                continue
+            self.rules.append((compiled, negate, dir_only))
+
+    @classmethod
+    def load(cls, directory):
+        rules = []
+        for name in IGNORE_FILES:
+            path = os.path.join(directory, name)
+            try:
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    rules.append(cls(directory, f.readlines()))
+            except OSError:
+                continue
+        return [r for r in rules if r.rules]
+
+    def match(self, path, is_dir):
+        """True to ignore, False to re-include, None if no pattern matches"""
+        # Paths handed to match() always live under base_dir
+        rel = path[len(self.base_dir):].lstrip(os.sep).replace(os.sep, "/")
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel):
+                result = not negate
+        return result
+
+def is_ignored(path, is_dir, rules):
+    """Apply ignore files from the root down; deeper and later patterns win"""
+    ignored = False
+    for r in rules:
+        result = r.match(path, is_dir)
+        if result is not None:
+            ignored = result
+    return ignored
+
+def _skip_dir(name):
+    return name in IGNORED_DIRS or name.endswith(".egg-info")
+
+def _skip_file_name(name, exts):
+    return "." not in name or name.rsplit(".", 1)[-1] not in exts or ".min." in name
+
+def _skip_file_contents(path, size, max_file_bytes):
+    """Skip oversized, binary and minified/generated files"""
+    if size > max_file_bytes:
+        return True
+    try:
+        with open(path, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+    except OSError:
+        return True
+    if b"\0" in head:
+        return True
+    # A full sniff block with hardly any newlines is minified or generated
+    if len(head) == SNIFF_BYTES and head.count(b"\n") < SNIFF_BYTES // 1000:
+        return True
+    return False
+
+def _list_dir(directory, rules, exts, max_file_bytes):
+    """One directory: returns (files to yield, (subdir, rules) pairs to visit)"""
+    try:
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except OSError:
+        return [], []
+    if any(e.name == "pyvenv.cfg" for e in entries):
+        # A virtualenv that is not named venv/.venv
+        return [], []
+    rules = rules + IgnoreRules.load(directory)
+    files, subdirs = [], []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if not _skip_dir(entry.name) and not is_ignored(entry.path, True, rules):
+                    subdirs.append((entry.path, rules))
+                continue
+            if not entry.is_file():
+                continue
+            if _skip_file_name(entry.name, exts):
+                continue
+            if is_ignored(entry.path, False, rules):
+                continue
+            if _skip_file_contents(entry.path, entry.stat().st_size, max_file_bytes):
+                continue
+            files.append(entry.path)
+        except OSError:
+            continue
+    return files, subdirs
+
+def scan_workspace(root_dir, exts=SCAN_EXTENSIONS,
+                   max_file_bytes=SCAN_MAX_FILE_BYTES, workers=1):
+    """
+    Yield source files under root_dir as they are found. With workers > 1,
+    directories are listed concurrently by a thread pool (os.scandir
+    releases the GIL) and paths are streamed through a bounded queue, so a
+    consumer can start before the walk finishes.
+    """
+    exts = set(exts)
+    if workers <= 1:
+        stack = [(root_dir, [])]
+        while stack:
+            directory, rules = stack.pop()
+            files, subdirs = _list_dir(directory, rules, exts, max_file_bytes)
+            yield from files
+            stack.extend(reversed(subdirs))
+        return
+    yield from _scan_parallel(root_dir, exts, max_file_bytes, workers)
+
+def _scan_parallel(root_dir, exts, max_file_bytes, workers):
+    dirs = queue.Queue()
+    found = queue.Queue(maxsize=4096)
+    done = object()
+    stop = threading.Event()
+    lock = threading.Lock()
+    outstanding = [1]  # directories queued but not yet listed
+    dirs.put((root_dir, []))
+
+    def worker():
+        while not stop.is_set():
+            item = dirs.get()
+            if item is done:
+                return
+            try:
+                files, subdirs = _list_dir(item[0], item[1], exts, max_file_bytes)
+                with lock:
+                    outstanding[0] += len(subdirs)
+                for subdir in subdirs:
+                    dirs.put(subdir)
+                for path in files:
+                    while not stop.is_set():
+                        try:
+                            found.put(path, timeout=0.5)
+                            break
+                        except queue.Full:
+                            continue
+            except Exception as e:
+                print(f"Skipping {item[0]}: {e}")
+            finally:
+                # Always account for the directory, or the consumer waits forever
+                with lock:
+                    outstanding[0] -= 1
+                    finished = outstanding[0] == 0
+                if finished:
+                    for _ in range(workers):
+                        dirs.put(done)
+                    while not stop.is_set():
+                        try:
+                            found.put(done, timeout=0.5)
+                            break
+                        except queue.Full:
+                            continue
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            path = found.get()
+            if path is done:
+                return
+            yield path
+    finally:
+        # Consumer stopped early: let the workers wind down
+        stop.set()
+        for _ in range(workers):
+            dirs.put(done)
+
+class PathFilter:
+    """
+    scan_workspace's verdict on single paths (watcher events, git diffs):
+    whether a file under root_dir would be left out of a scan. Ignore files
+    are read once per directory for the life of the filter.
+    """
+    def __init__(self, root_dir, exts=SCAN_EXTENSIONS, max_file_bytes=SCAN_MAX_FILE_BYTES):
+        self.root_dir = os.path.abspath(root_dir)
+        self.exts = set(exts)
+        self.max_file_bytes = max_file_bytes
+        self._rules = {}  # directory -> rules for its entries, None if the scan skips it
+
+    def _dir_rules(self, directory):
+        if directory in self._rules:
+            return self._rules[directory]
+        rules = []
+        if directory != self.root_dir:
+            parent = os.path.dirname(directory)
+            if parent == directory or not directory.startswith(self.root_dir + os.sep):
+                # Outside the workspace
+                rules = None
+            else:
+                rules = self._dir_rules(parent)
+                if rules is not None and (
+                    _skip_dir(os.path.basename(directory)) or is_ignored(directory, True, rules)
+                ):
+                    rules = None
+        if rules is not None:
+            if os.path.exists(os.path.join(directory, "pyvenv.cfg")):
+                rules = None
+            else:
+                rules = rules + IgnoreRules.load(directory)
+        self._rules[directory] = rules
+        return rules
+
+    def excludes(self, path):
+        """Whether a scan would leave out path; a deleted file is judged by its name"""
+        path = os.path.abspath(path)
+        rules = self._dir_rules(os.path.dirname(path))
+        if rules is None or _skip_file_name(os.path.basename(path), self.exts):
+            return True
+        if is_ignored(path, False, rules):
+            return True
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            return False
+        return _skip_file_contents(path, size, self.max_file_bytes)
 
 def chunk_file(file_path, max_lines=30):
     with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
@@ -16,4 +313,4 @@ def chunk_file(file_path, max_lines=30):
             'start_line': i+1
         }
         for i in range(0, len(lines), max_lines)
-    ]
\ No newline at end of file
+    ]